@@ -0,0 +1,169 @@
+"""Agronomic yield analytics over per-block monthly tonnage.
+
+The router fetches one row per (block, month) with the block's area and
+planting year; everything else is NumPy array arithmetic over a
+blocks x months tonnage matrix:
+
+- yield per hectare over the trailing 12 months, per block and estate-wide
+- the estate's rolling 12-month yield for every reported month
+- palm-age cohort curves: annualised t/ha for each palm age, weighted by
+  block area and months observed
+- block rankings, with each block compared to its age cohort
+"""
+
+from datetime import date
+import numpy as np
+
+ROLLING_MONTHS = 12
+
+
+def _month(value: date) -> np.datetime64:
+    return np.datetime64(value, "M")
+
+
+def window_start(as_of: date, report_months: int) -> date:
+    """First month whose tonnage the analytics for ``as_of`` need."""
+    first = _month(as_of) - (report_months + ROLLING_MONTHS - 2)
+    return first.astype(date)
+
+
+def _optional(values: np.ndarray, digits: int = 3) -> list:
+    """Round and turn NaN into None for JSON."""
+    return [None if np.isnan(v) else round(float(v), digits) for v in values]
+
+
+def _divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+
+def yield_analytics(
+    rows: list, first_month: date, report_months: int, as_of: date, limit: int
+) -> dict:
+    """Yield figures for ``report_months`` months ending with ``as_of``.
+
+    ``rows`` are (block_id, block_name, plantation_id, area_ha,
+    planting_year, month, tonnes) ordered by block, with ``month`` None for
+    blocks without harvests; ``first_month`` is ROLLING_MONTHS - 1 months before the first
+    reported month so the first rolling window is complete.
+    """
+    month_count = report_months + ROLLING_MONTHS - 1
+    month_axis = _month(first_month) + np.arange(month_count)
+    report_axis = month_axis[ROLLING_MONTHS - 1 :]
+
+    columns = list(zip(*rows)) if rows else [()] * 7
+    # Rows arrive grouped by block: a new block starts wherever the id changes
+    block_ids = np.array(columns[0], dtype=object)
+    starts = np.ones(len(block_ids), dtype=bool)
+    starts[1:] = block_ids[1:] != block_ids[:-1]
+    first_row = np.flatnonzero(starts)
+    block_of_row = np.cumsum(starts) - 1
+    ids = block_ids[first_row]
+    names = np.array(columns[1], dtype=object)[first_row]
+    plantation_ids = np.array(columns[2], dtype=object)[first_row]
+    area = np.array(columns[3], dtype=float)[first_row]
+    planted = np.array(columns[4], dtype=float)[first_row]
+    # Months as year * 12 + month - 1 (-1 for no harvest); converting date
+    # objects straight to datetime64 is several times slower
+    months = np.fromiter(
+        (-1 if m is None else m.year * 12 + m.month - 1 for m in columns[5]),
+        dtype=np.int64,
+        count=len(columns[5]),
+    )
+    tonnes = np.nan_to_num(np.array(columns[6], dtype=float))
+
+    # blocks x months tonnage matrix
+    harvested = months >= 0
+    matrix = np.zeros((len(ids), month_count))
+    np.add.at(
+        matrix,
+        (
+            block_of_row[harvested],
+            months[harvested] - (first_month.year * 12 + first_month.month - 1),
+        ),
+        tonnes[harvested],
+    )
+
+    # Trailing 12-month sums ending at each reported month
+    cumulative = np.cumsum(np.pad(matrix, ((0, 0), (1, 0))), axis=1)
+    rolling = cumulative[:, ROLLING_MONTHS:] - cumulative[:, :-ROLLING_MONTHS]
+    has_area = area > 0
+    estate_area = area[has_area].sum()
+    estate_rolling = _divide(
+        rolling[has_area].sum(axis=0), np.full(report_months, estate_area)
+    )
+
+    # Blocks planted after ``as_of`` have no age and are left out of rankings
+    current_age = as_of.year - planted
+    current_age[current_age < 0] = np.nan
+    block_tonnes_12m = rolling[:, -1]
+    block_yield_12m = _divide(block_tonnes_12m, np.where(has_area, area, 0))
+    block_yield_12m[np.isnan(current_age) & ~np.isnan(planted)] = np.nan
+
+    # Palm-age cohorts over the reported months
+    years = report_axis.astype("datetime64[Y]").astype(int) + 1970
+    ages = years[None, :] - planted[:, None]
+    observed = ~np.isnan(ages) & (ages >= 0) & has_area[:, None]
+    age_index = ages[observed].astype(int)
+    area_months = np.broadcast_to(area[:, None], ages.shape)[observed]
+    cohort_tonnes = np.bincount(
+        age_index, weights=matrix[:, ROLLING_MONTHS - 1 :][observed]
+    )
+    cohort_area_months = np.bincount(age_index, weights=area_months)
+    cohort_block_months = np.bincount(age_index)
+    cohort_yield = _divide(cohort_tonnes * ROLLING_MONTHS, cohort_area_months)
+    cohort_ages = np.flatnonzero(cohort_block_months)
+
+    # Each block against the cohort of its current age
+    known_cohort = ~np.isnan(current_age)
+    known_cohort[known_cohort] &= current_age[known_cohort] < len(cohort_yield)
+    block_cohort_yield = np.full(len(ids), np.nan)
+    block_cohort_yield[known_cohort] = cohort_yield[
+        current_age[known_cohort].astype(int)
+    ]
+    vs_cohort = _divide(block_yield_12m, block_cohort_yield) - 1
+
+    ranked = np.argsort(-np.nan_to_num(block_yield_12m, nan=-np.inf), kind="stable")
+    ranked = ranked[~np.isnan(block_yield_12m[ranked])]
+    rank_of = np.zeros(len(ids), dtype=int)
+    rank_of[ranked] = np.arange(1, len(ranked) + 1)
+
+    def block_entries(order):
+        return [
+            {
+                "rank": int(rank_of[index]),
+                "block_id": str(ids[index]),
+                "block_name": names[index],
+                "plantation_id": plantation_ids[index],
+                "area_ha": None if np.isnan(area[index]) else float(area[index]),
+                "planting_year": (
+                    None if np.isnan(planted[index]) else int(planted[index])
+                ),
+                "palm_age": (
+                    None if np.isnan(current_age[index]) else int(current_age[index])
+                ),
+                "tonnes_12m": round(float(block_tonnes_12m[index]), 3),
+                "yield_t_ha_12m": _optional(block_yield_12m[[index]])[0],
+                "cohort_yield_t_ha": _optional(block_cohort_yield[[index]])[0],
+                "vs_cohort": _optional(vs_cohort[[index]])[0],
+            }
+            for index in order
+        ]
+
+    return {
+        "start": report_axis[0].astype(date),
+        "end": as_of,
+        "block_count": len(ids),
+        "area_ha": round(float(estate_area), 3),
+        "tonnes_12m": round(float(block_tonnes_12m.sum()), 3),
+        "yield_t_ha_12m": _optional(estate_rolling[-1:])[0],
+        "months": [month.astype(date) for month in report_axis],
+        "rolling_12m_t_ha": _optional(estate_rolling),
+        "cohorts": {
+            "palm_age": cohort_ages.tolist(),
+            "yield_t_ha_yr": _optional(cohort_yield[cohort_ages]),
+            "block_months": cohort_block_months[cohort_ages].tolist(),
+        },
+        "top_blocks": block_entries(ranked[:limit]),
+        "bottom_blocks": block_entries(ranked[::-1][:limit]),
+    }
@@ -2,15 +2,18 @@ from datetime import datetime, timedelta
 from typing import Optional
 import hashlib
 from jose import JWTError, jwt
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer
 import os
 from dotenv import load_dotenv
 
+from cache import invalidate_principal, principal_cache
 from database import get_db
 from models import User
-from schemas import TokenData
+from schemas import TokenData, User as UserSchema
 
 load_dotenv()
 
@@ -31,12 +34,13 @@ def get_password_hash(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
 
-def get_user(db: Session, username: str):
-    return db.query(User).filter(User.username == username).first()
+async def get_user(db: AsyncSession, username: str):
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalars().first()
 
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user(db, username)
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await get_user(db, username)
     if not user:
         return False
     if not verify_password(password, user.hashed_password):
@@ -55,8 +59,30 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _forget_changed_principal(mapper, connection, target):
+    """Drop cached principals of users changed through the ORM.
+
+    The usernames are dropped again after commit, so a request that
+    re-cached the old row between flush and commit cannot keep it.
+    """
+    usernames = {target.username, *inspect(target).attrs.username.history.deleted}
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault("stale_principals", set()).update(usernames)
+    for username in usernames:
+        invalidate_principal(username)
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_committed_principals(session):
+    for username in session.info.pop("stale_principals", ()):
+        invalidate_principal(username)
+
+
 async def get_current_user(
-    token: str = Depends(security), db: Session = Depends(get_db)
+    token: str = Depends(security), db: AsyncSession = Depends(get_db)
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -71,9 +97,16 @@ async def get_current_user(
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = get_user(db, username=token_data.username)
-    if user is None:
+
+    user = principal_cache.get(token_data.username)
+    if user is not None:
+        return user
+
+    db_user = await get_user(db, username=token_data.username)
+    if db_user is None:
         raise credentials_exception
+    user = UserSchema.model_validate(db_user)
+    principal_cache.set(token_data.username, user)
     return user
 
 
@@ -81,3 +114,11 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
+
+
+async def get_current_admin_user(
+    current_user: User = Depends(get_current_active_user),
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return current_user
@@ -0,0 +1,217 @@
+"""Public batch-code trace: a Bloom filter of issued codes and HTTP caching.
+
+Consumers and mills scan the QR code on an FFB lot at random, often with
+mistyped or made-up codes. Each worker keeps a Bloom filter of every
+issued ``batch_code`` so codes that were never issued are refused without
+touching the database; found traces are cached (``cache.trace_cache``) and
+served with ``Cache-Control`` and ``ETag`` so browsers and CDNs reuse them.
+
+The filter is built in the background at startup (until then lookups go
+to the database), takes the codes this worker issues right away and picks
+up codes issued by other workers every ``TRACE_FILTER_REFRESH_SECONDS``.
+A Bloom filter has no false negatives, so that window (and a queued
+harvest not yet committed) is the only time a valid code can be refused;
+404s are therefore sent with ``no-store``.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+
+from database import AsyncSessionLocal
+from models import HarvestRecord
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TRACE_FILTER_ERROR_RATE = float(os.getenv("TRACE_FILTER_ERROR_RATE", 0.001))
+TRACE_FILTER_REFRESH_SECONDS = float(os.getenv("TRACE_FILTER_REFRESH_SECONDS", 30))
+TRACE_MAX_AGE_SECONDS = int(os.getenv("TRACE_MAX_AGE_SECONDS", 300))
+
+# Longest code the column can hold; anything longer was never issued
+MAX_BATCH_CODE_LENGTH = HarvestRecord.__table__.c.batch_code.type.length
+# The filter is sized for twice the codes it starts with, and rebuilt
+# once that capacity is used up
+MIN_CAPACITY = 100_000
+GROWTH_FACTOR = 2
+BUILD_CHUNK_SIZE = 50_000
+# Catch up on rows whose transaction committed a while after updated_at
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+
+class BloomFilter:
+    """Set membership with false positives at ``error_rate`` but no false
+    negatives. Probes use double hashing over Python's ``hash``, which is
+    randomised per process, so a filter never leaves its worker.
+    ``count`` is the number of distinct keys added, give or take false
+    positives."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(int(capacity), 1)
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self._probes = np.arange(self.hashes, dtype=np.uint64)
+        self._lock = threading.Lock()
+
+    def add_many(self, keys: Iterable[str]):
+        hashes = np.fromiter((hash(key) for key in keys), dtype=np.int64)
+        hashes = hashes.view(np.uint64)
+        low, high = hashes & 0xFFFFFFFF, (hashes >> 32) | 1
+        positions = (low[:, None] + self._probes * high[:, None]) % np.uint64(self.size)
+        masks = np.left_shift(1, positions & 7).astype(np.uint8)
+        with self._lock:
+            # Keys already (or seemingly) present don't use up capacity
+            present = np.all(self._bits[positions >> 3] & masks, axis=1)
+            self.count += int(np.count_nonzero(~present))
+            np.bitwise_or.at(self._bits, positions.ravel() >> 3, masks.ravel())
+
+    def __contains__(self, key: str) -> bool:
+        value = hash(key) & 0xFFFFFFFFFFFFFFFF
+        low, high = value & 0xFFFFFFFF, (value >> 32) | 1
+        for probe in range(self.hashes):
+            position = (low + probe * high) % self.size
+            if not self._bits[position >> 3] >> (position & 7) & 1:
+                return False
+        return True
+
+    @property
+    def nbytes(self) -> int:
+        return self._bits.nbytes
+
+
+class BatchCodeFilter:
+    """The worker's Bloom filter of issued batch codes, kept current by a
+    background task."""
+
+    def __init__(
+        self,
+        error_rate: float = TRACE_FILTER_ERROR_RATE,
+        refresh_seconds: float = TRACE_FILTER_REFRESH_SECONDS,
+    ):
+        self.error_rate = error_rate
+        self.refresh_seconds = refresh_seconds
+        self.rejected = 0
+        self.passed = 0
+        self.builds = 0
+        self._filter: Optional[BloomFilter] = None
+        self._synced_at: Optional[datetime] = None
+        self._building = False
+        self._added_while_building: List[str] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._filter is not None
+
+    def might_exist(self, batch_code: str) -> bool:
+        """False only for codes that were certainly never issued."""
+        bloom = self._filter
+        if len(batch_code) <= MAX_BATCH_CODE_LENGTH and (
+            bloom is None or batch_code in bloom
+        ):
+            self.passed += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def add(self, batch_codes: List[str]):
+        """Record codes issued by this worker; call after the commit."""
+        if self._building:
+            self._added_while_building.extend(batch_codes)
+        if self._filter is not None:
+            self._filter.add_many(batch_codes)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                bloom = self._filter
+                if bloom is None or bloom.count > bloom.capacity:
+                    await self.build()
+                else:
+                    await self.refresh()
+            except Exception:
+                logger.exception("Updating the batch code filter failed")
+            await asyncio.sleep(self.refresh_seconds)
+
+    async def build(self):
+        """Load every issued code into a new filter and swap it in."""
+        started = datetime.utcnow()
+        self._building = True
+        self._added_while_building = []
+        try:
+            async with AsyncSessionLocal() as db:
+                total = await db.scalar(select(func.count()).select_from(HarvestRecord))
+                bloom = BloomFilter(
+                    max(total * GROWTH_FACTOR, MIN_CAPACITY), self.error_rate
+                )
+                result = await db.stream_scalars(
+                    select(HarvestRecord.batch_code)
+                    .where(HarvestRecord.batch_code.is_not(None))
+                    .execution_options(yield_per=BUILD_CHUNK_SIZE)
+                )
+                async for codes in result.partitions():
+                    # Hashing a chunk takes milliseconds; keep it off the loop
+                    await asyncio.to_thread(bloom.add_many, codes)
+            bloom.add_many(self._added_while_building)
+            self._filter = bloom
+            self._synced_at = started
+            self.builds += 1
+        finally:
+            self._building = False
+            self._added_while_building = []
+
+    async def refresh(self):
+        """Add the codes other workers issued since the last sync."""
+        started = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            codes = (
+                await db.scalars(
+                    select(HarvestRecord.batch_code).where(
+                        HarvestRecord.updated_at >= self._synced_at - REFRESH_OVERLAP,
+                        HarvestRecord.batch_code.is_not(None),
+                    )
+                )
+            ).all()
+        if codes:
+            await asyncio.to_thread(self._filter.add_many, codes)
+        self._synced_at = started
+
+    def stats(self) -> dict:
+        bloom = self._filter
+        return {
+            "ready": bloom is not None,
+            "codes": bloom.count if bloom else 0,
+            "capacity": bloom.capacity if bloom else 0,
+            "bytes": bloom.nbytes if bloom else 0,
+            "error_rate": self.error_rate,
+            "builds": self.builds,
+            "passed": self.passed,
+            "rejected": self.rejected,
+        }
+
+
+batch_code_filter = BatchCodeFilter()
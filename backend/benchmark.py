@@ -0,0 +1,483 @@
+"""HTTP load benchmark for the API.
+
+Seeds a local database with the synthetic data generator, starts
+``uvicorn main:app`` against it and drives each workload for a fixed time
+at every requested concurrency, then writes the results as JSON:
+
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json --baseline before.json
+
+Workloads:
+    login       POST /auth/login
+    dashboard   polling GET /dashboard/stats and /dashboard/plantations
+    paging      GET /harvests/ following X-Next-Cursor for a few pages
+    create      bursts of POST /harvests/
+    trace       public GET /harvests/trace/{batch_code}, 10% unknown codes
+    mixed       all of the above, weighted like a working day
+
+The dataset depends only on the seed arguments and ``--end``, and the
+seeded SQLite template is copied for every run, so two runs with the same
+arguments measure the same data; ``meta`` records the commit and machine.
+With ``--database-url`` an existing (PostgreSQL) database is seeded when
+empty and used as is. Requires the dev requirements (httpx).
+"""
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime
+
+import httpx
+
+WORKLOADS = ["login", "dashboard", "paging", "create", "trace", "mixed"]
+MIXED_WEIGHTS = {"dashboard": 40, "paging": 25, "trace": 20, "create": 10, "login": 5}
+PAGE_SIZE = 100
+PAGES_PER_WALK = 5
+BURST_SIZE = 10
+API = "/api/v1"
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(
+        0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1)
+    )
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()
+
+    def record(self, endpoint: str, seconds: float, status: int, ok: bool):
+        self.samples[endpoint].append(seconds * 1000)
+        self.statuses[endpoint][status] += 1
+        if not ok:
+            self.errors[endpoint] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        def stats(latencies, errors, statuses):
+            latencies = sorted(latencies)
+            count = len(latencies)
+            return {
+                "requests": count,
+                "errors": errors,
+                "error_rate": errors / count if count else 0.0,
+                "throughput_rps": count / elapsed if elapsed else 0.0,
+                "latency_ms": {
+                    "p50": percentile(latencies, 0.50),
+                    "p95": percentile(latencies, 0.95),
+                    "p99": percentile(latencies, 0.99),
+                    "mean": sum(latencies) / count if count else 0.0,
+                    "max": latencies[-1] if latencies else 0.0,
+                },
+                "status_codes": {str(k): v for k, v in sorted(statuses.items())},
+            }
+
+        total = stats(
+            [ms for samples in self.samples.values() for ms in samples],
+            sum(self.errors.values()),
+            sum(self.statuses.values(), Counter()),
+        )
+        total["duration_seconds"] = elapsed
+        total["endpoints"] = {
+            endpoint: stats(samples, self.errors[endpoint], self.statuses[endpoint])
+            for endpoint, samples in sorted(self.samples.items())
+        }
+        return total
+
+
+class VirtualUser:
+    """One simulated client; each workload is one unit of its work."""
+
+    def __init__(self, client, recorder, fixtures, rng):
+        self.client = client
+        self.recorder = recorder
+        self.fixtures = fixtures
+        self.rng = rng
+        self.headers = {"Authorization": f"Bearer {fixtures['token']}"}
+
+    async def request(self, endpoint, method, url, expected=(200,), **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError:
+            response, status = None, 0
+        self.recorder.record(
+            endpoint, time.perf_counter() - start, status, status in expected
+        )
+        return response
+
+    async def login(self):
+        await self.request(
+            "POST /auth/login",
+            "POST",
+            f"{API}/auth/login",
+            data={"username": "admin", "password": "admin123"},
+        )
+
+    async def dashboard(self):
+        for path in ("/dashboard/stats", "/dashboard/plantations"):
+            await self.request(f"GET {path}", "GET", API + path, headers=self.headers)
+
+    async def paging(self):
+        params = {"limit": PAGE_SIZE}
+        for _ in range(PAGES_PER_WALK):
+            response = await self.request(
+                "GET /harvests/",
+                "GET",
+                f"{API}/harvests/",
+                params=params,
+                headers=self.headers,
+            )
+            cursor = response is not None and response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+            params = {"limit": PAGE_SIZE, "cursor": cursor}
+
+    async def create(self):
+        for _ in range(BURST_SIZE):
+            await self.request(
+                "POST /harvests/",
+                "POST",
+                f"{API}/harvests/",
+                json={
+                    "block_id": self.rng.choice(self.fixtures["block_ids"]),
+                    "harvester_id": self.rng.choice(self.fixtures["harvester_ids"]),
+                    "date": datetime.now().isoformat(timespec="seconds"),
+                    "tonnes_fresh_fruit_bunches": round(self.rng.uniform(0.5, 3), 2),
+                },
+                headers=self.headers,
+            )
+
+    async def trace(self):
+        if self.rng.random() < 0.1:
+            code = f"LOT-19700101-{self.rng.getrandbits(32):08X}"
+            await self.request(
+                "GET /harvests/trace/{unknown}",
+                "GET",
+                f"{API}/harvests/trace/{code}",
+                expected=(404,),
+            )
+        else:
+            code = self.rng.choice(self.fixtures["batch_codes"])
+            await self.request(
+                "GET /harvests/trace/{batch_code}",
+                "GET",
+                f"{API}/harvests/trace/{code}",
+            )
+
+    async def mixed(self):
+        names, weights = zip(*MIXED_WEIGHTS.items())
+        await getattr(self, self.rng.choices(names, weights)[0])()
+
+
+async def run_workload(
+    base_url, workload, concurrency, duration, warmup, fixtures, seed
+):
+    recorder = Recorder()
+    discard = Recorder()
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=30
+    ) as client:
+        started = time.perf_counter()
+        measure_from = started + warmup
+        deadline = measure_from + duration
+
+        async def user(number):
+            session = VirtualUser(
+                client, discard, fixtures, random.Random(seed + number)
+            )
+            while time.perf_counter() < deadline:
+                session.recorder = (
+                    recorder if time.perf_counter() >= measure_from else discard
+                )
+                await getattr(session, workload)()
+
+        await asyncio.gather(*(user(number) for number in range(concurrency)))
+        elapsed = time.perf_counter() - max(measure_from, started)
+    return recorder.summary(elapsed)
+
+
+def seed_database(database_url, args):
+    """Migrate the database and add data unless it already has plantations."""
+    os.environ["DATABASE_URL"] = database_url
+    from create_sample_data import create_sample_data
+    from create_users_simple import create_admin_user
+    from database import engine
+    import migrate
+
+    # Keep stdout clean for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        migrate.upgrade(engine)
+        create_sample_data(
+            args.plantations, args.blocks_per, args.years, args.seed, args.end
+        )
+        create_admin_user()
+    engine.dispose()
+
+
+def schema_fingerprint() -> str:
+    """Short hash of the table and index definitions, so cached templates
+    are re-seeded after schema changes."""
+    from sqlalchemy.dialects import sqlite
+    from sqlalchemy.schema import CreateIndex, CreateTable
+    from models import Base
+
+    dialect = sqlite.dialect()
+    ddl = []
+    for table in Base.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(dialect=dialect)))
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            ddl.append(str(CreateIndex(index).compile(dialect=dialect)))
+    return hashlib.sha1("\n".join(ddl).encode()).hexdigest()[:8]
+
+
+def load_fixtures(database_url, limit=2000) -> dict:
+    """Ids and batch codes the workloads pick from."""
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(database_url)
+    with engine.connect() as conn:
+        fixtures = {
+            "block_ids": conn.execute(text("SELECT id FROM blocks")).scalars().all(),
+            "harvester_ids": conn.execute(
+                text("SELECT id FROM employees WHERE position = 'Pemanen'")
+            )
+            .scalars()
+            .all(),
+            "batch_codes": conn.execute(
+                text("SELECT batch_code FROM harvest_records ORDER BY id LIMIT :n"),
+                {"n": limit},
+            )
+            .scalars()
+            .all(),
+        }
+    engine.dispose()
+    return fixtures
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_url, port, workers):
+    """Start uvicorn; returns the process and its seconds to first healthy
+    response."""
+    env = dict(os.environ, DATABASE_URL=database_url)
+    env.setdefault("SECRET_KEY", "benchmark")
+    env.setdefault("ALGORITHM", "HS256")
+    env.pop("ASYNC_DATABASE_URL", None)
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+        ],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+    )
+    started = time.monotonic()
+    deadline = started + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"Server exited with code {server.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                return server, time.monotonic() - started
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    server.terminate()
+    raise SystemExit("Server did not become healthy within 60 seconds")
+
+
+def git_revision() -> dict:
+    def git(*args):
+        result = subprocess.run(
+            ["git", *args],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(__file__),
+        )
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain")),
+    }
+
+
+def compare(results: dict, baseline: dict) -> dict:
+    """Relative change of throughput and latency percentiles per run."""
+    for field in ("dataset", "database", "uvicorn_workers", "cpu_count"):
+        if results["meta"][field] != baseline.get("meta", {}).get(field):
+            print(f"warning: baseline differs in {field}", file=sys.stderr)
+    changes = {}
+    for key, run in results["runs"].items():
+        before = baseline.get("runs", {}).get(key)
+        if not before:
+            continue
+        change = {}
+        if before["throughput_rps"]:
+            change["throughput_rps"] = (
+                run["throughput_rps"] / before["throughput_rps"] - 1
+            )
+        for metric in ("p50", "p95", "p99"):
+            if before["latency_ms"][metric]:
+                change[metric] = (
+                    run["latency_ms"][metric] / before["latency_ms"][metric] - 1
+                )
+        change["error_rate"] = run["error_rate"] - before["error_rate"]
+        changes[key] = change
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--workloads", default=",".join(WORKLOADS))
+    parser.add_argument("--concurrency", default="1,8,32", help="e.g. 1,8,32")
+    parser.add_argument("--duration", type=float, default=15, help="seconds per run")
+    parser.add_argument("--warmup", type=float, default=3, help="unmeasured seconds")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--database-url", help="default: a seeded SQLite copy")
+    parser.add_argument("--plantations", type=int, default=5)
+    parser.add_argument("--blocks-per", type=int, default=20)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end", type=date.fromisoformat, default=date(2025, 12, 31))
+    parser.add_argument("--output", help="JSON file (default: stdout)")
+    parser.add_argument("--baseline", help="earlier JSON result to compare with")
+    args = parser.parse_args()
+
+    workloads = args.workloads.split(",")
+    unknown = set(workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"unknown workloads: {', '.join(sorted(unknown))}")
+    concurrencies = [int(value) for value in args.concurrency.split(",")]
+
+    scratch = tempfile.TemporaryDirectory()
+    if args.database_url:
+        database_url = args.database_url
+        seed_database(database_url, args)
+    else:
+        # The seeded template is kept between runs; each run gets a fresh copy
+        template = os.path.join(
+            tempfile.gettempdir(),
+            f"fapagri-bench-{args.plantations}-{args.blocks_per}-{args.years}"
+            f"-{args.seed}-{args.end}-{schema_fingerprint()}.db",
+        )
+        if not os.path.exists(template):
+            seed_database(f"sqlite:///{template}.tmp", args)
+            os.replace(f"{template}.tmp", template)
+        working_copy = os.path.join(scratch.name, "bench.db")
+        shutil.copyfile(template, working_copy)
+        database_url = f"sqlite:///{working_copy}"
+
+    port = free_port()
+    server, startup_seconds = start_server(database_url, port, args.workers)
+    print(f"Server healthy after {startup_seconds:.2f}s", file=sys.stderr)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        fixtures = load_fixtures(database_url)
+        fixtures["token"] = httpx.post(
+            f"{base_url}{API}/auth/login",
+            data={"username": "admin", "password": "admin123"},
+        ).json()["access_token"]
+
+        runs = {}
+        for workload in workloads:
+            for concurrency in concurrencies:
+                key = f"{workload}@{concurrency}"
+                print(f"Running {key} for {args.duration:g}s...", file=sys.stderr)
+                runs[key] = asyncio.run(
+                    run_workload(
+                        base_url,
+                        workload,
+                        concurrency,
+                        args.duration,
+                        args.warmup,
+                        fixtures,
+                        args.seed,
+                    )
+                )
+                runs[key].update(workload=workload, concurrency=concurrency)
+    finally:
+        server.terminate()
+        server.wait()
+        scratch.cleanup()
+
+    results = {
+        "meta": {
+            **git_revision(),
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "database": database_url.split(":", 1)[0],
+            "uvicorn_workers": args.workers,
+            "startup_seconds": round(startup_seconds, 3),
+            "duration_seconds": args.duration,
+            "warmup_seconds": args.warmup,
+            "dataset": {
+                "plantations": args.plantations,
+                "blocks_per": args.blocks_per,
+                "years": args.years,
+                "seed": args.seed,
+                "end": args.end.isoformat(),
+            },
+        },
+        "runs": runs,
+    }
+    if args.baseline:
+        with open(args.baseline) as file:
+            results["vs_baseline"] = compare(results, json.load(file))
+
+    for key, run in runs.items():
+        latency = run["latency_ms"]
+        print(
+            f"{key:<16} {run['throughput_rps']:>9.1f} req/s  "
+            f"p50 {latency['p50']:>7.1f}  p95 {latency['p95']:>7.1f}  "
+            f"p99 {latency['p99']:>7.1f} ms  errors {run['error_rate']:.2%}",
+            file=sys.stderr,
+        )
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
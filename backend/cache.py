@@ -0,0 +1,131 @@
+"""Small in-process TTL + LRU cache for read-mostly API data.
+
+Each uvicorn worker keeps its own caches. Writes handled by a worker
+invalidate that worker's entries immediately; other workers pick the
+change up once their entries expire, so ``CACHE_TTL_SECONDS`` bounds how
+stale a read can be.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", 30))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 1024))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 60))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", 4096))
+TRACE_CACHE_TTL_SECONDS = float(os.getenv("TRACE_CACHE_TTL_SECONDS", 300))
+TRACE_CACHE_MAX_ENTRIES = int(os.getenv("TRACE_CACHE_MAX_ENTRIES", 10000))
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(
+        self,
+        name: str,
+        ttl: float = CACHE_TTL_SECONDS,
+        max_entries: int = CACHE_MAX_ENTRIES,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    async def get_or_load(
+        self, key: Hashable, loader: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = await loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key: Hashable = _MISSING):
+        """Drop one key, or every entry when called without a key."""
+        with self._lock:
+            if key is _MISSING:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Caches shared by the routers
+dashboard_cache = TTLCache("dashboard")
+plantation_cache = TTLCache("plantations")
+# Authenticated users by username, so the auth dependency skips the users table
+principal_cache = TTLCache(
+    "principals",
+    ttl=PRINCIPAL_CACHE_TTL_SECONDS,
+    max_entries=PRINCIPAL_CACHE_MAX_ENTRIES,
+)
+# Public batch traces by code; harvest records are never edited, only the
+# block and plantation they point to
+trace_cache = TTLCache(
+    "trace", ttl=TRACE_CACHE_TTL_SECONDS, max_entries=TRACE_CACHE_MAX_ENTRIES
+)
+
+CACHES = [dashboard_cache, plantation_cache, principal_cache, trace_cache]
+
+
+def invalidate_plantations():
+    """Call after any plantation create/update/delete."""
+    plantation_cache.invalidate()
+    dashboard_cache.invalidate()
+    trace_cache.invalidate()
+
+
+def invalidate_harvests():
+    """Call after harvest records are committed."""
+    dashboard_cache.invalidate()
+
+
+def invalidate_principal(username: str):
+    """Call when a user is changed, deactivated or deleted."""
+    principal_cache.invalidate(username)
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {cache.name: cache.stats() for cache in CACHES}
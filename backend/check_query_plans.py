@@ -0,0 +1,265 @@
+"""Query-plan regression check for the API.
+
+Migrates and seeds a scratch database, calls every router endpoint through
+the FastAPI test client while recording the SELECT statements they send,
+then runs EXPLAIN on each statement. The check fails (exit code 1) when a statement
+reads one of the large tables with a full table scan instead of an index.
+Endpoints are also held to their declared query budgets (see
+query_budget.py), so an N+1 regression fails it as well, and so does a
+model change without a matching migration.
+
+    python check_query_plans.py
+        uses a temporary SQLite file
+    PLAN_CHECK_DATABASE_URL=postgresql://.../scratch python check_query_plans.py
+        uses an empty PostgreSQL database (tables are created and seeded);
+        sequential scans are disabled while explaining, so any remaining
+        "Seq Scan" means no index can serve the query
+
+Requires the dev requirements (httpx for the test client).
+"""
+
+import os
+import re
+import sys
+import tempfile
+
+_scratch_dir = None
+if os.getenv("PLAN_CHECK_DATABASE_URL"):
+    os.environ["DATABASE_URL"] = os.environ["PLAN_CHECK_DATABASE_URL"]
+else:
+    _scratch_dir = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{_scratch_dir.name}/plans.db"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ.setdefault("SECRET_KEY", "query-plan-check")
+os.environ.setdefault("ALGORITHM", "HS256")
+# Endpoints over their declared query budget (N+1) fail the check as well
+os.environ.setdefault("QUERY_BUDGET_MODE", "raise")
+# Covers the write-behind harvest endpoints too
+_spool_dir = tempfile.TemporaryDirectory()
+os.environ["HARVEST_QUEUE_ENABLED"] = "true"
+os.environ["HARVEST_SPOOL_DIR"] = _spool_dir.name
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from database import SessionLocal, async_engine, engine  # noqa: E402
+from instrumentation import current_request  # noqa: E402
+from models import Block, Employee, HarvestRecord, Plantation  # noqa: E402
+from sync import MAX_SYNC_PAGE_SIZE  # noqa: E402
+import migrate  # noqa: E402
+
+# Tables that grow without bound; a full scan of these is a regression
+WATCHED_TABLES = {"harvest_records", "harvest_daily_rollup"}
+
+_ALIAS = re.compile(r"\b(\w+)\s+AS\s+(\w+)", re.IGNORECASE)
+_SQLITE_SCAN = re.compile(r"^SCAN (\w+)$")
+_POSTGRES_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def seed():
+    from create_sample_data import create_sample_data
+    from create_users_simple import create_admin_user
+
+    migrate.upgrade(engine)
+    create_sample_data()
+    create_admin_user()
+
+
+def build_calls():
+    """One call of each read and write path: [(method, path, kwargs)]."""
+    db = SessionLocal()
+    try:
+        plantation = db.query(Plantation).first()
+        block = db.query(Block).first()
+        harvester = db.query(Employee).first()
+        harvest = db.query(HarvestRecord).first()
+    finally:
+        db.close()
+
+    new_harvest = {
+        "block_id": block.id,
+        "harvester_id": harvester.id,
+        "date": "2024-01-15T07:00:00",
+        "tonnes_fresh_fruit_bunches": 2.5,
+    }
+    near = {"lat": harvest.geo_lat, "lng": harvest.geo_lng, "radius_m": 500}
+    bbox = {
+        "min_lat": harvest.geo_lat - 0.01,
+        "min_lng": harvest.geo_lng - 0.01,
+        "max_lat": harvest.geo_lat + 0.01,
+        "max_lng": harvest.geo_lng + 0.01,
+    }
+    return [
+        ("GET", "/api/v1/auth/me", {}),
+        ("GET", "/api/v1/auth/users", {"params": {"limit": 1}}),
+        ("GET", "/api/v1/plantations/", {"params": {"limit": 1}}),
+        ("GET", f"/api/v1/plantations/{plantation.id}", {}),
+        ("GET", "/api/v1/harvests/", {"params": {"limit": 5}}),
+        ("GET", f"/api/v1/harvests/{harvest.id}", {}),
+        ("GET", f"/api/v1/harvests/block/{block.id}", {}),
+        ("GET", f"/api/v1/harvests/trace/{harvest.batch_code}", {}),
+        (
+            "GET",
+            "/api/v1/harvests/export",
+            {"params": {"from": "2020-01-01", "to": "2100-01-01"}},
+        ),
+        (
+            "GET",
+            "/api/v1/harvests/export",
+            {"params": {"format": "ndjson", "plantation_id": plantation.id}},
+        ),
+        ("POST", "/api/v1/harvests/", {"json": new_harvest}),
+        ("POST", "/api/v1/harvests/bulk", {"json": [new_harvest] * 3}),
+        ("POST", "/api/v1/harvests/queue", {"json": new_harvest}),
+        ("GET", f"/api/v1/harvests/queue/{harvest.id}", {}),
+        ("GET", "/api/v1/dashboard/stats", {}),
+        ("GET", f"/api/v1/dashboard/plantation/{plantation.id}", {}),
+        ("GET", "/api/v1/dashboard/plantations", {}),
+        (
+            "GET",
+            "/api/v1/dashboard/timeseries",
+            {"params": {"granularity": "week", "group_by": "block"}},
+        ),
+        (
+            "GET",
+            "/api/v1/dashboard/timeseries",
+            {"params": {"granularity": "month", "group_by": "harvester"}},
+        ),
+        ("GET", "/api/v1/analytics/yield", {}),
+        ("GET", "/api/v1/plantations/geo/bbox", {"params": bbox}),
+        (
+            "GET",
+            "/api/v1/plantations/geo/nearby",
+            {
+                "params": {
+                    "lat": plantation.location_lat,
+                    "lng": plantation.location_lng,
+                }
+            },
+        ),
+        ("GET", "/api/v1/harvests/geo/bbox", {"params": bbox}),
+        ("GET", "/api/v1/harvests/geo/nearby", {"params": near}),
+        ("GET", "/api/v1/harvests/geo/tiles", {"params": bbox}),
+        ("GET", "/api/v1/harvests/geo/tiles", {"params": {**bbox, "precision": 4}}),
+        ("GET", "/api/v1/sync", {"params": {"limit": 5}}),
+    ]
+
+
+def capture_statements():
+    """Run every call and return [(label, statement, parameters)]."""
+    captured = []
+    current = {"label": "login"}
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        # Background tasks (e.g. building the trace filter) scan on purpose
+        if current_request.get() is None:
+            return
+        if not executemany and statement.lstrip().upper().startswith(
+            ("SELECT", "WITH")
+        ):
+            captured.append((current["label"], statement, parameters))
+
+    with TestClient(__import__("main").app) as client:
+        login = client.post(
+            "/api/v1/auth/login", data={"username": "admin", "password": "admin123"}
+        )
+        login.raise_for_status()
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+        next_cursor = sync_token = None
+        for method, path, kwargs in build_calls():
+            current["label"] = f"{method} {path}"
+            response = client.request(method, path, headers=headers, **kwargs)
+            if response.status_code >= 400:
+                raise SystemExit(f"{current['label']} failed: {response.status_code}")
+            if path == "/api/v1/harvests/":
+                next_cursor = response.headers.get("X-Next-Cursor")
+            if path == "/api/v1/sync":
+                sync_token = response.json()["token"]
+
+        if next_cursor:
+            current["label"] = "GET /api/v1/harvests/?cursor="
+            client.get(
+                "/api/v1/harvests/",
+                params={"limit": 5, "cursor": next_cursor},
+                headers=headers,
+            ).raise_for_status()
+
+        # The next page of a first sync, the rest of it, then the next round
+        for limit in (5, MAX_SYNC_PAGE_SIZE, 5):
+            current["label"] = "GET /api/v1/sync?since="
+            sync_token = (
+                client.get(
+                    "/api/v1/sync",
+                    params={"limit": limit, "since": sync_token},
+                    headers=headers,
+                )
+                .raise_for_status()
+                .json()["token"]
+            )
+
+    event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+    return captured
+
+
+def explain(conn, statement, parameters):
+    """Return the full-scanned watched tables in the plan of one statement."""
+    tables = {alias: table for table, alias in _ALIAS.findall(statement)}
+    if conn.dialect.name == "sqlite":
+        plan = conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN " + statement, tuple(parameters)
+        ).all()
+        scanned = [
+            match.group(1)
+            for match in (_SQLITE_SCAN.match(row[-1]) for row in plan)
+            if match
+        ]
+        lines = [row[-1] for row in plan]
+    else:
+        # asyncpg uses $n placeholders; psycopg2 expects %s
+        sync_sql = re.sub(r"\$\d+", "%s", statement.replace("%", "%%"))
+        plan = conn.exec_driver_sql("EXPLAIN " + sync_sql, tuple(parameters)).all()
+        lines = [row[0] for row in plan]
+        scanned = [
+            match.group(1)
+            for match in (_POSTGRES_SCAN.search(line) for line in lines)
+            if match
+        ]
+    full_scans = {tables.get(name, name) for name in scanned} & WATCHED_TABLES
+    return full_scans, lines
+
+
+def main() -> int:
+    seed()
+    # The migrated schema must match models.py, or the plans below lie
+    missing = migrate.drift(engine)
+    if missing:
+        print("Migrations do not create: " + ", ".join(missing))
+        return 1
+    captured = capture_statements()
+
+    failures = 0
+    seen = set()
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.exec_driver_sql("SET enable_seqscan = off")
+        for label, statement, parameters in captured:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            full_scans, lines = explain(conn, statement, parameters)
+            status = "FULL SCAN" if full_scans else "ok"
+            print(f"[{status}] {label}")
+            if full_scans:
+                failures += 1
+                print("    " + " ".join(statement.split()))
+                for line in lines:
+                    print("      " + line)
+
+    print(f"\n{len(seen)} statements checked, {failures} full scans")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
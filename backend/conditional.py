@@ -0,0 +1,118 @@
+"""Conditional GET: ETag / Last-Modified validators and 304 responses.
+
+Read endpoints compute a validator from data that is cheap to fetch (an
+entity's ``updated_at``, or ``max(updated_at)`` and row counts of the
+tables behind a list or dashboard) before loading anything else. When
+the client's ``If-None-Match`` / ``If-Modified-Since`` still matches, the
+endpoint answers ``304 Not Modified`` without loading or serializing the
+response body.
+
+Lists and dashboards only get an ETag: deletes don't move
+``max(updated_at)`` and dashboards also depend on today's date, so a
+modification time alone would not be a sound validator for them.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import NamedTuple, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import dashboard_cache
+from models import Block, Employee, HarvestDailyRollup, Plantation
+
+# Clients keep the body but ask again on every use
+CACHE_CONTROL = "private, no-cache"
+# OpenAPI entry for endpoints using this module
+RESPONSES = {304: {"description": "Not modified (If-None-Match/If-Modified-Since)"}}
+
+
+class Validator(NamedTuple):
+    etag: str
+    last_modified: Optional[datetime] = None
+
+
+def validator(*parts, last_modified: Optional[datetime] = None) -> Validator:
+    """Weak validator over ``parts``, which must identify the representation
+    (endpoint, query parameters and data version)."""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+    return Validator(f'W/"{digest}"', last_modified)
+
+
+def etag_for(body: bytes) -> str:
+    """Strong ETag of a serialized body."""
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header lists ``etag`` (weak comparison)."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in (
+        candidate.removeprefix("W/") for candidate in candidates
+    )
+
+
+def _http_date(value: datetime) -> str:
+    # Naive datetimes in the database are UTC
+    return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+def is_fresh(request: Request, current: Validator) -> bool:
+    """Whether the client's cached copy is still current. If-None-Match
+    takes precedence over If-Modified-Since (RFC 9110, 13.2.2)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, current.etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since or current.last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have whole seconds
+    modified = current.last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+    return modified <= since
+
+
+def headers(current: Validator) -> dict:
+    result = {"ETag": current.etag, "Cache-Control": CACHE_CONTROL}
+    if current.last_modified is not None:
+        result["Last-Modified"] = _http_date(current.last_modified)
+    return result
+
+
+def not_modified(
+    request: Request, response: Response, current: Validator
+) -> Optional[Response]:
+    """Return a 304 response when the client's copy is current; otherwise
+    put the validators on ``response`` and return None."""
+    if is_fresh(request, current):
+        return Response(status_code=304, headers=headers(current))
+    response.headers.update(headers(current))
+    return None
+
+
+async def data_version(db: AsyncSession) -> tuple:
+    """Version of the data behind the dashboards: the newest daily rollup
+    change (every harvest write and rebuild stamps it with the server
+    clock) and the row counts and newest changes of plantations, blocks
+    and employees, in one statement of index lookups and small tables.
+    Cached in ``dashboard_cache``, which every harvest or plantation write
+    clears."""
+
+    async def load():
+        parts = [select(func.max(HarvestDailyRollup.updated_at)).scalar_subquery()]
+        for model in (Plantation, Block, Employee):
+            parts.append(select(func.count()).select_from(model).scalar_subquery())
+            parts.append(select(func.max(model.updated_at)).scalar_subquery())
+        return tuple((await db.execute(select(*parts))).one())
+
+    return await dashboard_cache.get_or_load(("version",), load)
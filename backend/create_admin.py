@@ -1,12 +1,9 @@
 # Buat user admin default
 from sqlalchemy.orm import Session
-from database import SessionLocal, engine
-from models import User, Base
+from database import SessionLocal
+from models import User
 from auth import get_password_hash
 
-# Create tables
-Base.metadata.create_all(bind=engine)
-
 
 def create_admin_user():
     db = SessionLocal()
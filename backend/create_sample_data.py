@@ -1,155 +1,360 @@
-from sqlalchemy.orm import Session
-from database import SessionLocal
-from models import Plantation, Block, Employee, HarvestRecord
-from datetime import datetime, timedelta
+"""Deterministic synthetic plantation data, from a demo set to capacity tests.
+
+    python create_sample_data.py
+        2 plantations, 3 blocks each, one year of harvests (~3k records)
+    python create_sample_data.py --plantations 50 --blocks-per 40 --years 12
+        ~10M harvest records
+
+Blocks are harvested on a 7-10 day rotation. Each round is split over a
+crew taken in turn from the plantation's harvester pool, so harvesters
+rotate across blocks. Yield follows the palm age curve (immature blocks are
+not harvested) and a seasonal curve peaking in October.
+
+Rows are generated from ``--seed`` only, so the same arguments (including
+``--end``) always produce the same dataset. Harvests are written in chunks,
+with COPY on PostgreSQL (psycopg2) and driver-level executemany on SQLite; the
+secondary indexes of harvest_records are dropped during the load and
+rebuilt afterwards, then the daily rollup is recomputed.
+"""
+
+import argparse
+import csv
+import io
+import math
+import random
 import uuid
+from datetime import date, datetime, time, timedelta
+from typing import Iterator, Optional
 
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
 
-def create_sample_data():
-    db = SessionLocal()
-    try:
-        # Check if sample data already exists
-        if db.query(Plantation).count() > 0:
-            print("ℹ️ Sample data already exists!")
-            return
-
-        print("🌱 Creating sample plantation data...")
-
-        # Create sample plantations
-        plantation1 = Plantation(
-            name="Kebun Sawit Utama",
-            location_lat=-2.5489,
-            location_lng=117.8924,
-            area_ha=150.5,
-            address="Kalimantan Tengah, Indonesia",
-        )
-        plantation2 = Plantation(
-            name="Kebun Sawit Selatan",
-            location_lat=-3.2345,
-            location_lng=118.1234,
-            area_ha=87.3,
-            address="Kalimantan Selatan, Indonesia",
-        )
+from database import engine
+from models import Block, Employee, HarvestRecord, Plantation
+import geo
+import rollup
+
+CHUNK_SIZE = 50_000
+# Area one harvester covers in a round; sets the crew size of a block
+HA_PER_HARVESTER = 2.5
+
+REGIONS = [
+    ("Kalimantan Tengah", -2.2, 113.9),
+    ("Kalimantan Selatan", -3.1, 115.3),
+    ("Kalimantan Timur", 0.5, 116.4),
+    ("Kalimantan Barat", -0.1, 111.1),
+    ("Riau", 0.5, 101.4),
+    ("Jambi", -1.6, 103.6),
+    ("Sumatera Utara", 2.1, 99.5),
+    ("Sumatera Selatan", -3.3, 104.0),
+]
+NOTES = [
+    "Harvest normal, cuaca cerah",
+    "Harvest sedikit terlambat karena hujan",
+    "Akses jalan blok licin",
+    "Buah restan dari rotasi sebelumnya",
+]
+HARVEST_COLUMNS = [
+    "id",
+    "block_id",
+    "harvester_id",
+    "date",
+    "tonnes_fresh_fruit_bunches",
+    "batch_code",
+    "geo_lat",
+    "geo_lng",
+    "geohash",
+    "notes",
+    "created_at",
+    "updated_at",
+]
+
+
+def age_yield(age: int) -> float:
+    """Fresh fruit bunches in tonnes per hectare per year at a palm age."""
+    if age < 3:
+        return 0.0
+    if age < 9:
+        return 6.0 + (age - 3) * 19.0 / 6
+    if age <= 18:
+        return 25.0
+    return max(12.0, 25.0 * 0.97 ** (age - 18))
+
+
+def seasonal_factor(month: int) -> float:
+    """Relative monthly output: high from September to November."""
+    return 1.0 + 0.25 * math.cos(2 * math.pi * (month - 10) / 12)
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def build_estates(rng: random.Random, plantations: int, blocks_per: int, end: date):
+    """Plantation, block and employee rows, each block's harvest plan and
+    the harvester pool of each plantation."""
+    plantation_rows, block_rows, employee_rows, plans, pools = [], [], [], [], []
+    created_at = datetime.combine(end, time())
+    for p in range(plantations):
+        region, lat, lng = REGIONS[p % len(REGIONS)]
+        plantation = {
+            "id": _uuid(rng),
+            "name": f"Kebun Sawit {p + 1:03d}",
+            "location_lat": round(lat + rng.uniform(-0.5, 0.5), 6),
+            "location_lng": round(lng + rng.uniform(-0.5, 0.5), 6),
+            "address": f"{region}, Indonesia",
+            "created_at": created_at,
+            "updated_at": created_at,
+        }
+        blocks = []
+        for b in range(blocks_per):
+            block = {
+                "id": _uuid(rng),
+                "plantation_id": plantation["id"],
+                "name": f"Blok {chr(ord('A') + b // 99 % 26)}{b % 99 + 1}",
+                "area_ha": round(rng.uniform(15, 35), 1),
+                "planting_year": end.year - rng.randint(4, 25),
+                "created_at": created_at,
+                "updated_at": created_at,
+            }
+            blocks.append(block)
+            plans.append(
+                {
+                    "block": block,
+                    "crew_size": max(1, round(block["area_ha"] / HA_PER_HARVESTER)),
+                    "rotation": rng.randint(7, 10),
+                    "offset": rng.randint(0, 9),
+                    "quality": rng.uniform(0.85, 1.15),
+                    "lat": plantation["location_lat"] + rng.uniform(-0.05, 0.05),
+                    "lng": plantation["location_lng"] + rng.uniform(-0.05, 0.05),
+                    "plantation": p,
+                }
+            )
+        plantation["area_ha"] = round(sum(b["area_ha"] for b in blocks), 1)
+        plantation_rows.append(plantation)
+        block_rows.extend(blocks)
+
+        # Enough harvesters for about one block round per person per day
+        crews = [plan["crew_size"] for plan in plans[-blocks_per:]]
+        pool_size = max(4, max(crews, default=0), math.ceil(sum(crews) / 7))
+        pool = []
+        for e in range(pool_size + 1):
+            employee = {
+                "id": _uuid(rng),
+                "name": f"Karyawan {p + 1:03d}-{e + 1:03d}",
+                "employee_code": f"EMP{p + 1:03d}{e + 1:04d}",
+                "position": "Mandor" if e == 0 else "Pemanen",
+                "phone": f"08{rng.randint(10**9, 10**10 - 1)}",
+                "is_active": True,
+                "created_at": created_at,
+                "updated_at": created_at,
+            }
+            employee_rows.append(employee)
+            if e:
+                pool.append(employee["id"])
+        pools.append(pool)
+    return plantation_rows, block_rows, employee_rows, plans, pools
 
-        db.add(plantation1)
-        db.add(plantation2)
-        db.commit()
-        db.refresh(plantation1)
-        db.refresh(plantation2)
-
-        # Create sample blocks
-        blocks = [
-            Block(
-                plantation_id=plantation1.id,
-                name="Blok A1",
-                area_ha=25.0,
-                planting_year=2018,
-            ),
-            Block(
-                plantation_id=plantation1.id,
-                name="Blok A2",
-                area_ha=30.5,
-                planting_year=2019,
-            ),
-            Block(
-                plantation_id=plantation1.id,
-                name="Blok A3",
-                area_ha=28.0,
-                planting_year=2020,
-            ),
-            Block(
-                plantation_id=plantation2.id,
-                name="Blok B1",
-                area_ha=22.3,
-                planting_year=2017,
-            ),
-            Block(
-                plantation_id=plantation2.id,
-                name="Blok B2",
-                area_ha=35.0,
-                planting_year=2018,
-            ),
-        ]
-
-        for block in blocks:
-            db.add(block)
-        db.commit()
-
-        # Create sample employees
-        employees = [
-            Employee(
-                name="Ahmad Subandi",
-                employee_code="EMP001",
-                position="Mandor",
-                phone="081234567890",
-            ),
-            Employee(
-                name="Siti Rahayu",
-                employee_code="EMP002",
-                position="Pemanen",
-                phone="081234567891",
-            ),
-            Employee(
-                name="Budi Santoso",
-                employee_code="EMP003",
-                position="Pemanen",
-                phone="081234567892",
-            ),
-            Employee(
-                name="Wati Suryani",
-                employee_code="EMP004",
-                position="Supervisor",
-                phone="081234567893",
-            ),
-        ]
-
-        for employee in employees:
-            db.add(employee)
-        db.commit()
-
-        # Create sample harvest records
-        base_date = datetime.now() - timedelta(days=30)
-
-        sample_harvests = []
-        for i in range(15):
-            harvest_date = base_date + timedelta(days=i * 2)
-            batch_code = (
-                f"LOT-{harvest_date.strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
+
+def harvest_rows(
+    rng: random.Random, plans, pools, start: date, end: date
+) -> Iterator[tuple]:
+    """Harvest records in date order, as tuples in HARVEST_COLUMNS order."""
+    next_harvester = [0] * len(pools)
+    salt = rng.getrandbits(32)
+    sequence = 0
+
+    for day_number in range((end - start).days + 1):
+        day = start + timedelta(days=day_number)
+        season = seasonal_factor(day.month)
+        for plan in plans:
+            if (day_number + plan["offset"]) % plan["rotation"]:
+                continue
+            block = plan["block"]
+            per_ha = age_yield(day.year - block["planting_year"])
+            if not per_ha:
+                continue
+            round_tonnes = (
+                per_ha
+                * plan["quality"]
+                * block["area_ha"]
+                * season
+                * plan["rotation"]
+                / 365
             )
+            pool = pools[plan["plantation"]]
+            first = next_harvester[plan["plantation"]]
+            next_harvester[plan["plantation"]] = (first + plan["crew_size"]) % len(pool)
+            for member in range(plan["crew_size"]):
+                harvested_at = datetime.combine(day, time(6)) + timedelta(
+                    minutes=rng.randint(0, 8 * 60)
+                )
+                # Bijective in the sequence number, so codes never collide
+                code = (sequence * 0x9E3779B1 + salt) & 0xFFFFFFFF
+                sequence += 1
+                record_id = _uuid(rng)
+                tonnes = round(
+                    round_tonnes / plan["crew_size"] * rng.uniform(0.75, 1.25), 2
+                )
+                lat = round(plan["lat"] + rng.uniform(-0.003, 0.003), 6)
+                lng = round(plan["lng"] + rng.uniform(-0.003, 0.003), 6)
+                yield (
+                    record_id,
+                    block["id"],
+                    pool[(first + member) % len(pool)],
+                    harvested_at,
+                    tonnes,
+                    f"LOT-{day:%Y%m%d}-{code:08X}",
+                    lat,
+                    lng,
+                    geo.encode(lat, lng),
+                    rng.choice(NOTES) if rng.random() < 0.05 else None,
+                    harvested_at,
+                    harvested_at,
+                )
+
+
+def _chunks(rows: Iterator[tuple], size: int) -> Iterator[list]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _copy_chunk(conn, table, chunk: list):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in chunk:
+        writer.writerow(["" if value is None else value for value in row])
+    buffer.seek(0)
+    cursor = conn.connection.cursor()
+    cursor.copy_expert(
+        f"COPY {table.name} ({', '.join(HARVEST_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+        buffer,
+    )
+
+
+def _sqlite_writer(conn, table):
+    """Driver-level executemany, formatting each row's timestamp only once."""
+    to_db = table.c.date.type.dialect_impl(conn.dialect).bind_processor(conn.dialect)
+    statement = (
+        f"INSERT INTO {table.name} ({', '.join(HARVEST_COLUMNS)}) "
+        f"VALUES ({', '.join('?' * len(HARVEST_COLUMNS))})"
+    )
+
+    def write(chunk: list):
+        rows = []
+        for row in chunk:
+            when = to_db(row[3])
+            rows.append(row[:3] + (when,) + row[4:10] + (when, when))
+        conn.exec_driver_sql(statement, rows)
+
+    return write
+
 
-            harvest = HarvestRecord(
-                block_id=blocks[i % len(blocks)].id,
-                harvester_id=employees[i % len(employees)].id,
-                date=harvest_date,
-                tonnes_fresh_fruit_bunches=round(2.5 + (i % 3) * 1.2, 2),
-                batch_code=batch_code,
-                geo_lat=-2.5489 + (i * 0.001),
-                geo_lng=117.8924 + (i * 0.001),
-                notes=(
-                    f"Harvest normal, cuaca cerah"
-                    if i % 2 == 0
-                    else "Harvest sedikit terlambat karena hujan"
-                ),
+def load_harvests(conn, rows: Iterator[tuple], chunk_size: int = CHUNK_SIZE) -> int:
+    """Write harvest rows in chunks; returns the number of rows written."""
+    table = HarvestRecord.__table__
+    if conn.dialect.name == "postgresql" and conn.dialect.driver == "psycopg2":
+        write = lambda chunk: _copy_chunk(conn, table, chunk)  # noqa: E731
+    elif conn.dialect.name == "sqlite":
+        write = _sqlite_writer(conn, table)
+    else:
+        write = lambda chunk: conn.execute(  # noqa: E731
+            insert(table), [dict(zip(HARVEST_COLUMNS, row)) for row in chunk]
+        )
+
+    # Building the indexes once is far cheaper than maintaining them per row
+    for index in table.indexes:
+        index.drop(bind=conn)
+    total = 0
+    for chunk in _chunks(rows, chunk_size):
+        write(chunk)
+        total += len(chunk)
+        print(f"   - {total:,} harvest records", end="\r", flush=True)
+    print()
+    for index in table.indexes:
+        index.create(bind=conn)
+    return total
+
+
+def create_sample_data(
+    plantations: int = 2,
+    blocks_per: int = 3,
+    years: int = 1,
+    seed: int = 42,
+    end: Optional[date] = None,
+    chunk_size: int = CHUNK_SIZE,
+):
+    end = end or date.today()
+    start = end - timedelta(days=round(365.25 * years) - 1)
+    try:
+        with engine.begin() as conn:
+            # Check if sample data already exists
+            if conn.execute(select(func.count()).select_from(Plantation)).scalar():
+                print("ℹ️ Sample data already exists!")
+                return
+
+            print(
+                f"🌱 Creating {plantations} plantations x {blocks_per} blocks, "
+                f"harvests {start} to {end} (seed {seed})..."
+            )
+            if conn.dialect.name == "sqlite":
+                # Only while loading; must run before the first write
+                conn.exec_driver_sql("PRAGMA synchronous = OFF")
+            rng = random.Random(seed)
+            plantation_rows, block_rows, employee_rows, plans, pools = build_estates(
+                rng, plantations, blocks_per, end
             )
-            sample_harvests.append(harvest)
+            conn.execute(insert(Plantation), plantation_rows)
+            conn.execute(insert(Block), block_rows)
+            conn.execute(insert(Employee), employee_rows)
 
-        for harvest in sample_harvests:
-            db.add(harvest)
-        db.commit()
+            harvests = load_harvests(
+                conn,
+                harvest_rows(rng, plans, pools, start, end),
+                chunk_size,
+            )
+            rollup_rows = rollup.rebuild(Session(bind=conn))
 
         print("✅ Sample data created successfully!")
         print(f"📊 Created:")
-        print(f"   - {len([plantation1, plantation2])} Plantations")
-        print(f"   - {len(blocks)} Blocks")
-        print(f"   - {len(employees)} Employees")
-        print(f"   - {len(sample_harvests)} Harvest Records")
+        print(f"   - {len(plantation_rows)} Plantations")
+        print(f"   - {len(block_rows)} Blocks")
+        print(f"   - {len(employee_rows)} Employees")
+        print(f"   - {harvests:,} Harvest Records")
+        print(f"   - {rollup_rows:,} Daily rollup rows")
 
     except Exception as e:
         print(f"❌ Error creating sample data: {e}")
-        db.rollback()
-    finally:
-        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--plantations", type=int, default=2)
+    parser.add_argument("--blocks-per", type=int, default=3)
+    parser.add_argument("--years", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--end",
+        type=date.fromisoformat,
+        help="last harvest day, YYYY-MM-DD (default: today)",
+    )
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+    create_sample_data(
+        args.plantations,
+        args.blocks_per,
+        args.years,
+        args.seed,
+        args.end,
+        args.chunk_size,
+    )
 
 
 if __name__ == "__main__":
-    create_sample_data()
+    main()
@@ -1,10 +1,7 @@
 import hashlib
 from sqlalchemy.orm import Session
-from database import SessionLocal, engine
-from models import User, Base
-
-# Create tables
-Base.metadata.create_all(bind=engine)
+from database import SessionLocal
+from models import User
 
 
 def simple_hash(password: str) -> str:
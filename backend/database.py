@@ -1,22 +1,111 @@
 from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
 
+from instrumentation import instrument_engine
+from pool_metrics import InstrumentedQueuePool, instrument_pool
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Async drivers for the API: asyncpg for PostgreSQL, aiosqlite for local SQLite
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+# Databases the API has SQL for: the rollup upserts (rollup.py) and date
+# buckets (timeseries.py) are written per dialect
+SUPPORTED_DIALECTS = ("postgresql", "sqlite")
+
+# Connection pool of the API engine
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true")
+
+
+def pool_options(url: str) -> dict:
+    # In-memory SQLite lives in a single connection; keep the dialect default
+    if url.startswith("sqlite") and (":memory:" in url or url.endswith("://")):
+        return {}
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+_engine = None
+_session_factory = None
+
+
+def get_engine():
+    """Sync engine for scripts and maintenance commands. Created on first
+    use, so API workers never load the sync driver."""
+    global _engine
+    if _engine is None:
+        _engine = create_engine(DATABASE_URL)
+    return _engine
+
+
+def get_session_factory():
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = sessionmaker(
+            autocommit=False, autoflush=False, bind=get_engine()
+        )
+    return _session_factory
+
+
+def __getattr__(name):
+    # ``engine`` and ``SessionLocal`` are created lazily on first access
+    if name == "engine":
+        return get_engine()
+    if name == "SessionLocal":
+        return get_session_factory()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Async engine used by the API routers
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL)
+)
+instrument_pool(async_engine.sync_engine.pool)
+instrument_engine(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
 
-Base = declarative_base()
+def check_dialect(engine):
+    """Refuse to start on an unsupported database, instead of answering
+    500 on the first harvest write or chart."""
+    name = engine.dialect.name
+    if name not in SUPPORTED_DIALECTS:
+        raise RuntimeError(
+            f"Unsupported database {name!r}; "
+            f"supported: {', '.join(SUPPORTED_DIALECTS)}"
+        )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
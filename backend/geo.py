@@ -0,0 +1,286 @@
+"""Geohash-based spatial access paths that work on SQLite and PostgreSQL.
+
+Rows with coordinates store the geohash of their point (``GEOHASH_PRECISION``
+characters, ~5 m) in an indexed string column. Geohash strings sort in
+Z-order, so a bounding box is covered by a few geohash cells and each run
+of consecutive cells becomes one B-tree range scan (``geohash >= lo AND
+geohash < hi``); the exact latitude/longitude test then only runs on rows
+inside those cells. Radius searches use the bounding box of the circle and
+refine by great-circle distance. Map tiles group rows by a geohash prefix;
+tiles up to ``TILE_ROLLUP_PRECISION`` are summed from harvest_tile_rollup.
+
+When PostgreSQL has the PostGIS extension, bounding box and radius
+searches use a GiST index on the point geography instead (created by
+``migrations/0001_baseline.py``).
+"""
+
+import math
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, Query
+from sqlalchemy import and_, func, literal_column, or_, text
+
+GEOHASH_PRECISION = 9
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Cells used to cover a search box; fewer means coarser cells and more
+# rows to refine, more means more index ranges
+MAX_COVER_CELLS = 32
+MAX_TILES = 256
+# Cell size of harvest_tile_rollup (~5 km); finer tiles read harvest_records
+TILE_ROLLUP_PRECISION = 5
+# Largest explicit tile grid a request may ask for
+MAX_TILE_CELLS = 4096
+EARTH_RADIUS_M = 6_371_008.8
+METERS_PER_DEGREE = 111_320.0
+
+BBox = Tuple[float, float, float, float]  # min_lat, min_lng, max_lat, max_lng
+
+
+def _spread(value: int) -> int:
+    """Insert a zero bit between the bits of ``value`` (up to 32 bits)."""
+    value = (value | (value << 16)) & 0x0000FFFF0000FFFF
+    value = (value | (value << 8)) & 0x00FF00FF00FF00FF
+    value = (value | (value << 4)) & 0x0F0F0F0F0F0F0F0F
+    value = (value | (value << 2)) & 0x3333333333333333
+    return (value | (value << 1)) & 0x5555555555555555
+
+
+def _bits(precision: int) -> Tuple[int, int]:
+    """Longitude and latitude bits of a geohash of ``precision`` characters."""
+    total = 5 * precision
+    return (total + 1) // 2, total // 2
+
+
+def _cell_code(lat_index: int, lng_index: int, precision: int) -> str:
+    # Longitude takes the most significant bit of every bit pair
+    total = 5 * precision
+    if total % 2:
+        value = _spread(lng_index) | (_spread(lat_index) << 1)
+    else:
+        value = (_spread(lng_index) << 1) | _spread(lat_index)
+    return "".join(BASE32[(value >> shift) & 31] for shift in range(total - 5, -1, -5))
+
+
+def _cell_index(lat: float, lng: float, precision: int) -> Tuple[int, int]:
+    lng_bits, lat_bits = _bits(precision)
+    lat_cells, lng_cells = 1 << lat_bits, 1 << lng_bits
+    lat_index = min(int((lat + 90.0) / 180.0 * lat_cells), lat_cells - 1)
+    lng_index = min(int((lng + 180.0) / 360.0 * lng_cells), lng_cells - 1)
+    return max(lat_index, 0), max(lng_index, 0)
+
+
+def encode(
+    lat: Optional[float], lng: Optional[float], precision: int = GEOHASH_PRECISION
+) -> Optional[str]:
+    """Geohash of a point, or None when a coordinate is missing."""
+    if lat is None or lng is None:
+        return None
+    return _cell_code(*_cell_index(lat, lng, precision), precision)
+
+
+def geohash_default(lat_column: str, lng_column: str):
+    """Column default computing the geohash from the row's coordinates."""
+
+    def default(context):
+        params = context.get_current_parameters()
+        return encode(params.get(lat_column), params.get(lng_column))
+
+    return default
+
+
+def _cell_span(bbox: BBox, precision: int) -> Tuple[range, range]:
+    min_lat, min_lng, max_lat, max_lng = bbox
+    low = _cell_index(min_lat, min_lng, precision)
+    high = _cell_index(max_lat, max_lng, precision)
+    return range(low[0], high[0] + 1), range(low[1], high[1] + 1)
+
+
+def cell_count(bbox: BBox, precision: int) -> int:
+    lat_span, lng_span = _cell_span(bbox, precision)
+    return len(lat_span) * len(lng_span)
+
+
+def precision_for(bbox: BBox, max_cells: int, finest: int = GEOHASH_PRECISION) -> int:
+    """Finest precision at which ``bbox`` spans at most ``max_cells`` cells."""
+    for precision in range(finest, 0, -1):
+        if cell_count(bbox, precision) <= max_cells:
+            return precision
+    return 1
+
+
+def cells(bbox: BBox, precision: int) -> set:
+    """Geohash cells of ``precision`` characters intersecting ``bbox``."""
+    lat_span, lng_span = _cell_span(bbox, precision)
+    return {
+        _cell_code(lat_index, lng_index, precision)
+        for lat_index in lat_span
+        for lng_index in lng_span
+    }
+
+
+def cover(
+    bbox: BBox, max_cells: int = MAX_COVER_CELLS, finest: int = GEOHASH_PRECISION
+) -> List[str]:
+    """Sorted geohash cells (at most ``finest`` characters) whose union
+    contains ``bbox``."""
+    return sorted(cells(bbox, precision_for(bbox, max_cells, finest)))
+
+
+def _value(code: str) -> int:
+    value = 0
+    for char in code:
+        value = value * 32 + BASE32.index(char)
+    return value
+
+
+def prefix_ranges(codes: List[str]) -> List[Tuple[str, str]]:
+    """Merge sorted, equally long cells into [lo, hi) string ranges.
+
+    ``hi`` is the last cell of a run followed by "~", which sorts after
+    every geohash character, so the range holds all longer codes too.
+    """
+    ranges = []
+    for cell in codes:
+        if ranges and _value(cell) == _value(ranges[-1][1]) + 1:
+            ranges[-1][1] = cell
+        else:
+            ranges.append([cell, cell])
+    return [(first, last + "~") for first, last in ranges]
+
+
+def cover_filter(geohash_column, bbox: BBox, finest: int = GEOHASH_PRECISION):
+    """WHERE clause matching the geohash cells that cover ``bbox``; codes in
+    the column must be at least ``finest`` characters long."""
+    ranges = prefix_ranges(cover(bbox, finest=finest))
+    return or_(*(and_(geohash_column >= lo, geohash_column < hi) for lo, hi in ranges))
+
+
+def bbox_filter(geohash_column, lat_column, lng_column, bbox: BBox):
+    """WHERE clause: geohash index ranges, then the exact box test."""
+    min_lat, min_lng, max_lat, max_lng = bbox
+    return and_(
+        cover_filter(geohash_column, bbox),
+        lat_column.between(min_lat, max_lat),
+        lng_column.between(min_lng, max_lng),
+    )
+
+
+def radius_bbox(lat: float, lng: float, radius_m: float) -> BBox:
+    """Bounding box of a circle (clamped to valid coordinates)."""
+    dlat = radius_m / METERS_PER_DEGREE
+    dlng = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+    return (
+        max(lat - dlat, -90.0),
+        max(lng - dlng, -180.0),
+        min(lat + dlat, 90.0),
+        min(lng + dlng, 180.0),
+    )
+
+
+def distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle (haversine) distance in meters."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = (
+        math.sin(dphi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def tile_precision(bbox: BBox, max_tiles: int = MAX_TILES) -> int:
+    return precision_for(bbox, max_tiles, finest=GEOHASH_PRECISION - 1)
+
+
+def bbox_query(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lng: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lng: float = Query(..., ge=-180, le=180),
+) -> BBox:
+    """Bounding box query parameters (boxes across the antimeridian are
+    not supported)."""
+    if min_lat > max_lat or min_lng > max_lng:
+        raise HTTPException(
+            status_code=400, detail="min_lat/min_lng must not exceed max_lat/max_lng"
+        )
+    return min_lat, min_lng, max_lat, max_lng
+
+
+# PostGIS
+
+# Spatial index per table: (index name, latitude column, longitude column)
+POSTGIS_INDEXES = {
+    "plantations": ("ix_plantations_geography", "location_lat", "location_lng"),
+    "harvest_records": ("ix_harvest_records_geography", "geo_lat", "geo_lng"),
+}
+
+
+def postgis_index_sql(table_name: str) -> str:
+    name, lat, lng = POSTGIS_INDEXES[table_name]
+    return (
+        f"CREATE INDEX IF NOT EXISTS {name} ON {table_name} USING gist "
+        f"(geography(ST_SetSRID(ST_MakePoint({lng}, {lat}), 4326)))"
+    )
+
+
+def geography(lat_column, lng_column):
+    """The point geography expression the GiST indexes are built on."""
+    # The SRID stays a literal so the expression matches the index
+    return func.geography(
+        func.ST_SetSRID(
+            func.ST_MakePoint(lng_column, lat_column), literal_column("4326")
+        )
+    )
+
+
+def _point(lat: float, lng: float):
+    return func.geography(func.ST_SetSRID(func.ST_MakePoint(lng, lat), 4326))
+
+
+def within_bbox(postgis: bool, geohash_column, lat_column, lng_column, bbox: BBox):
+    """WHERE clause selecting the points inside ``bbox``."""
+    if not postgis:
+        return bbox_filter(geohash_column, lat_column, lng_column, bbox)
+    min_lat, min_lng, max_lat, max_lng = bbox
+    envelope = func.geography(
+        func.ST_MakeEnvelope(min_lng, min_lat, max_lng, max_lat, 4326)
+    )
+    return and_(
+        geography(lat_column, lng_column).op("&&")(envelope),
+        lat_column.between(min_lat, max_lat),
+        lng_column.between(min_lng, max_lng),
+    )
+
+
+def postgis_within(lat_column, lng_column, lat: float, lng: float, radius_m: float):
+    """WHERE clause and distance expression of a PostGIS radius search."""
+    point = _point(lat, lng)
+    location = geography(lat_column, lng_column)
+    return (
+        func.ST_DWithin(location, point, radius_m),
+        func.ST_Distance(location, point),
+    )
+
+
+_postgis_available = {}
+
+
+def has_postgis(sync_conn) -> bool:
+    """Whether the database behind ``sync_conn`` has PostGIS (cached)."""
+    if sync_conn.dialect.name != "postgresql":
+        return False
+    key = str(sync_conn.engine.url)
+    if key not in _postgis_available:
+        _postgis_available[key] = bool(
+            sync_conn.execute(
+                text("SELECT 1 FROM pg_extension WHERE extname = 'postgis'")
+            ).scalar()
+        )
+    return _postgis_available[key]
+
+
+async def use_postgis(db) -> bool:
+    """``has_postgis`` for an AsyncSession."""
+    return await db.run_sync(lambda session: has_postgis(session.connection()))
@@ -0,0 +1,352 @@
+"""Write-behind queue for harvest creation (group commit).
+
+During the morning weigh-in rush every ``POST /harvests/`` pays its own
+commit. ``POST /harvests/queue`` instead validates the record, gives it
+its ``id`` and ``batch_code`` right away and answers ``202 Accepted``;
+the worker inserts the queued records in one transaction once
+``HARVEST_QUEUE_MAX_BATCH`` of them are waiting or the oldest has waited
+``HARVEST_QUEUE_MAX_DELAY_MS``. ``GET /harvests/queue/{id}`` reports
+whether a record is still queued, committed or failed.
+
+Before a record is accepted it is appended to a spool file in
+``HARVEST_SPOOL_DIR``; a segment is deleted once all its records are
+committed. Each worker holds a lock on its own segments, so segments
+whose lock can be taken at startup belong to a worker that died, and are
+replayed (records already committed are skipped). Appends are flushed to
+the OS, which survives a crashed or killed worker; set
+``HARVEST_SPOOL_FSYNC=true`` to also survive power loss at the cost of
+one fsync per record.
+
+Enabled with ``HARVEST_QUEUE_ENABLED=true``; leftover spool segments are
+replayed either way.
+"""
+
+import asyncio
+import fcntl
+import glob
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import orjson
+from dotenv import load_dotenv
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from batch_trace import batch_code_filter
+from cache import invalidate_harvests
+from database import AsyncSessionLocal
+from live_dashboard import dashboard_feed
+from models import HarvestRecord
+import fast_json
+import rollup
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+HARVEST_QUEUE_ENABLED = os.getenv("HARVEST_QUEUE_ENABLED", "false").lower() == "true"
+HARVEST_QUEUE_MAX_BATCH = int(os.getenv("HARVEST_QUEUE_MAX_BATCH", 200))
+HARVEST_QUEUE_MAX_DELAY_MS = float(os.getenv("HARVEST_QUEUE_MAX_DELAY_MS", 50))
+HARVEST_QUEUE_MAX_PENDING = int(os.getenv("HARVEST_QUEUE_MAX_PENDING", 10000))
+HARVEST_SPOOL_DIR = os.getenv("HARVEST_SPOOL_DIR", "harvest_spool")
+HARVEST_SPOOL_FSYNC = os.getenv("HARVEST_SPOOL_FSYNC", "false").lower() == "true"
+
+# Wait before retrying a flush the database refused
+RETRY_SECONDS = 1.0
+# Outcomes kept for status lookups
+MAX_FINISHED = 50_000
+
+QUEUED = "queued"
+COMMITTED = "committed"
+FAILED = "failed"
+
+_DATETIME_FIELDS = ("date", "created_at", "updated_at")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class _Segment:
+    """One spool file; removed once sealed and all its records are done."""
+
+    def __init__(self, path: str, recovered: bool = False):
+        self.path = path
+        self.file = open(path, "ab")
+        try:
+            # Held until the segment is removed; released by the OS when
+            # the worker dies
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.file.close()
+            raise
+        self.outstanding = 0
+        self.sealed = recovered
+
+    @classmethod
+    def create(cls, directory: str) -> "_Segment":
+        name = f"harvests-{os.getpid()}-{uuid.uuid4().hex[:12]}.jsonl"
+        return cls(os.path.join(directory, name))
+
+    async def append(self, row: dict):
+        self.outstanding += 1
+        self.file.write(fast_json.dumps(row) + b"\n")
+        self.file.flush()
+        if HARVEST_SPOOL_FSYNC:
+            await asyncio.to_thread(os.fsync, self.file.fileno())
+
+    def done(self, count: int):
+        self.outstanding -= count
+        self._remove_if_done()
+
+    def seal(self):
+        self.sealed = True
+        self._remove_if_done()
+
+    def _remove_if_done(self):
+        if self.sealed and self.outstanding <= 0 and not self.file.closed:
+            os.unlink(self.path)
+            self.file.close()
+
+
+def _read_segment(path: str) -> List[dict]:
+    rows = []
+    with open(path, "rb") as spool:
+        for line in spool:
+            try:
+                row = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                # The worker died halfway through this line; it was never
+                # acknowledged
+                continue
+            for field in _DATETIME_FIELDS:
+                if row.get(field) is not None:
+                    row[field] = datetime.fromisoformat(row[field])
+            rows.append(row)
+    return rows
+
+
+class _Entry:
+    __slots__ = ("row", "segment", "maybe_committed")
+
+    def __init__(self, row: dict, segment: _Segment, maybe_committed: bool = False):
+        self.row = row
+        self.segment = segment
+        # Replayed, or retried after a failed commit that may have landed
+        self.maybe_committed = maybe_committed
+
+
+class HarvestQueue:
+    def __init__(
+        self,
+        spool_dir: str = HARVEST_SPOOL_DIR,
+        max_batch: int = HARVEST_QUEUE_MAX_BATCH,
+        max_delay_ms: float = HARVEST_QUEUE_MAX_DELAY_MS,
+        max_pending: int = HARVEST_QUEUE_MAX_PENDING,
+    ):
+        self.spool_dir = spool_dir
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.max_pending = max_pending
+        self.flushes = 0
+        self.committed = 0
+        self.failed = 0
+        self._pending: List[_Entry] = []
+        self._queued: Dict[str, _Entry] = {}
+        # id -> (status, batch_code, error) of records no longer queued
+        self._finished: "OrderedDict[str, tuple]" = OrderedDict()
+        self._segment: Optional[_Segment] = None
+        self._has_pending: Optional[asyncio.Event] = None
+        self._batch_full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def accepting(self) -> bool:
+        return HARVEST_QUEUE_ENABLED and self._task is not None
+
+    async def submit(self, row: dict):
+        """Spool and queue a validated harvest row (with ``id`` and
+        ``batch_code``). Raises QueueFull when the backlog is too long."""
+        if len(self._pending) >= self.max_pending:
+            raise QueueFull()
+        if self._segment is None:
+            self._segment = _Segment.create(self.spool_dir)
+        segment = self._segment
+        await segment.append(row)
+        self._enqueue(_Entry(row, segment))
+
+    def _enqueue(self, entry: _Entry):
+        self._pending.append(entry)
+        self._queued[entry.row["id"]] = entry
+        self._has_pending.set()
+        if len(self._pending) >= self.max_batch:
+            self._batch_full.set()
+
+    def status(self, harvest_id: str) -> Optional[tuple]:
+        """(status, batch_code, error) known to this worker, or None."""
+        entry = self._queued.get(harvest_id)
+        if entry is not None:
+            return QUEUED, entry.row["batch_code"], None
+        return self._finished.get(harvest_id)
+
+    def _finish(self, row: dict, status: str, error: Optional[str] = None):
+        self._queued.pop(row["id"], None)
+        self._finished[row["id"]] = (status, row["batch_code"], error)
+        while len(self._finished) > MAX_FINISHED:
+            self._finished.popitem(last=False)
+
+    def start(self):
+        if not HARVEST_QUEUE_ENABLED and not os.path.isdir(self.spool_dir):
+            return
+        if self._task is None:
+            self._has_pending = asyncio.Event()
+            self._batch_full = asyncio.Event()
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self._recover()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Drain what is left; on failure the spool keeps it for next start
+        if self._pending:
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Flushing the harvest queue at shutdown failed")
+
+    def _recover(self):
+        """Queue the records of segments left behind by dead workers."""
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, "*.jsonl"))):
+            try:
+                segment = _Segment(path, recovered=True)
+            except BlockingIOError:
+                continue  # a live worker's segment
+            rows = _read_segment(path)
+            logger.info("Replaying %d spooled harvests from %s", len(rows), path)
+            for row in rows:
+                segment.outstanding += 1
+                self._enqueue(_Entry(row, segment, maybe_committed=True))
+            segment.done(0)
+
+    async def _run(self):
+        while True:
+            await self._has_pending.wait()
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Flushing the harvest queue failed; retrying")
+                await asyncio.sleep(RETRY_SECONDS)
+
+    async def flush(self):
+        """Commit every queued record, ``max_batch`` per transaction."""
+        entries, self._pending = self._pending, []
+        self._has_pending.clear()
+        self._batch_full.clear()
+        if self._segment is not None:
+            # New records go to a new segment; this one only shrinks now
+            self._segment.seal()
+            self._segment = None
+
+        for start in range(0, len(entries), self.max_batch):
+            batch = entries[start : start + self.max_batch]
+            try:
+                await self._commit(batch)
+            except BaseException:
+                # Keep the unfinished rest, in order, for the next attempt
+                unfinished = [
+                    entry
+                    for entry in entries[start:]
+                    if entry.row["id"] in self._queued
+                ]
+                for entry in batch:
+                    entry.maybe_committed = True
+                self._pending[:0] = unfinished
+                self._has_pending.set()
+                raise
+        self.flushes += 1
+
+    async def _commit(self, batch: List[_Entry]):
+        async with AsyncSessionLocal() as db:
+            uncertain = [entry.row["id"] for entry in batch if entry.maybe_committed]
+            if uncertain:
+                existing = set(
+                    await db.scalars(
+                        select(HarvestRecord.id).where(HarvestRecord.id.in_(uncertain))
+                    )
+                )
+                for entry in batch:
+                    if entry.row["id"] in existing:
+                        self._finish(entry.row, COMMITTED)
+                        entry.segment.done(1)
+                batch = [entry for entry in batch if entry.row["id"] not in existing]
+                if not batch:
+                    return
+
+            try:
+                await self._insert(db, [entry.row for entry in batch])
+                failures = {}
+            except IntegrityError:
+                # A block or harvester was deleted after validation; find
+                # the bad records one by one
+                await db.rollback()
+                failures = await self._insert_each(db, batch)
+
+        rows = [entry.row for entry in batch if entry.row["id"] not in failures]
+        if rows:
+            invalidate_harvests()
+            batch_code_filter.add([row["batch_code"] for row in rows])
+            dashboard_feed.record_harvests(
+                (row["date"], row["tonnes_fresh_fruit_bunches"]) for row in rows
+            )
+        for entry in batch:
+            error = failures.get(entry.row["id"])
+            self._finish(entry.row, FAILED if error else COMMITTED, error)
+            entry.segment.done(1)
+        self.committed += len(rows)
+        self.failed += len(failures)
+
+    async def _insert(self, db, rows: List[dict]):
+        now = datetime.utcnow()
+        for row in rows:
+            # Stamp the commit, so delta sync and the trace filter see rows
+            # that waited in the queue
+            row["updated_at"] = now
+        await db.execute(insert(HarvestRecord), rows)
+        await db.run_sync(rollup.apply_harvests, rows)
+        await db.commit()
+
+    async def _insert_each(self, db, batch: List[_Entry]) -> Dict[str, str]:
+        failures = {}
+        for entry in batch:
+            try:
+                await self._insert(db, [entry.row])
+            except IntegrityError as e:
+                await db.rollback()
+                failures[entry.row["id"]] = str(e.orig)
+        return failures
+
+    def stats(self) -> dict:
+        return {
+            "enabled": HARVEST_QUEUE_ENABLED,
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "committed": self.committed,
+            "failed": self.failed,
+        }
+
+
+harvest_queue = HarvestQueue()
@@ -0,0 +1,221 @@
+"""Per-route request and SQL instrumentation, rendered for Prometheus.
+
+``InstrumentationMiddleware`` resolves each request to its route template
+(``/api/v1/harvests/{harvest_id}`` rather than the raw path, to keep label
+cardinality bounded) and records latency, status codes and in-flight
+requests. SQLAlchemy cursor events attribute every statement and its
+execution time to the request that issued it through a context variable.
+"""
+
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class RequestStats:
+    __slots__ = ("sql_statements", "sql_seconds")
+
+    def __init__(self):
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar(
+    "current_request", default=None
+)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> list:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.total}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.in_flight = defaultdict(int)
+        self.latency = {}
+        self.statements_per_request = {}
+        self.sql_statements = defaultdict(int)
+        self.sql_seconds = defaultdict(float)
+
+    def start(self, key):
+        with self._lock:
+            self.in_flight[key] += 1
+
+    def finish(self, key, status: int, seconds: float, stats: RequestStats):
+        with self._lock:
+            self.in_flight[key] -= 1
+            self.requests[key + (status,)] += 1
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.statements_per_request[key] = Histogram(STATEMENT_BUCKETS)
+            self.latency[key].observe(seconds)
+            self.statements_per_request[key].observe(stats.sql_statements)
+            self.sql_statements[key] += stats.sql_statements
+            self.sql_seconds[key] += stats.sql_seconds
+
+    def render(self) -> list:
+        with self._lock:
+            lines = [
+                "# HELP http_requests_total Requests by route and status code.",
+                "# TYPE http_requests_total counter",
+            ]
+            for (method, route, status), count in sorted(self.requests.items()):
+                labels = f'{_labels(method, route)},status="{status}"'
+                lines.append(f"http_requests_total{{{labels}}} {count}")
+            lines += [
+                "# HELP http_requests_in_flight Requests currently being served.",
+                "# TYPE http_requests_in_flight gauge",
+            ]
+            for (method, route), count in sorted(self.in_flight.items()):
+                lines.append(
+                    f"http_requests_in_flight{{{_labels(method, route)}}} {count}"
+                )
+            lines += [
+                "# HELP http_request_duration_seconds Request latency by route.",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            for (method, route), histogram in sorted(self.latency.items()):
+                lines += histogram.render(
+                    "http_request_duration_seconds", _labels(method, route)
+                )
+            lines += [
+                "# HELP http_request_sql_statements SQL statements per request.",
+                "# TYPE http_request_sql_statements histogram",
+            ]
+            for (method, route), histogram in sorted(
+                self.statements_per_request.items()
+            ):
+                lines += histogram.render(
+                    "http_request_sql_statements", _labels(method, route)
+                )
+            lines += [
+                "# HELP db_statements_total SQL statements executed, by route.",
+                "# TYPE db_statements_total counter",
+            ]
+            for (method, route), count in sorted(self.sql_statements.items()):
+                lines.append(f"db_statements_total{{{_labels(method, route)}}} {count}")
+            lines += [
+                "# HELP db_statement_seconds_total Time spent executing SQL, by route.",
+                "# TYPE db_statement_seconds_total counter",
+            ]
+            for (method, route), seconds in sorted(self.sql_seconds.items()):
+                lines.append(
+                    f"db_statement_seconds_total{{{_labels(method, route)}}} {seconds}"
+                )
+            return lines
+
+
+def _labels(method: str, route: str) -> str:
+    route = route.replace("\\", "\\\\").replace('"', '\\"')
+    return f'method="{method}",route="{route}"'
+
+
+registry = Registry()
+
+
+def match_route(scope):
+    """The application route serving ``scope``, or None."""
+    app = scope.get("app")
+    for route in getattr(getattr(app, "router", None), "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route
+    return None
+
+
+def _route_template(scope) -> str:
+    route = match_route(scope)
+    return route.path if route is not None else UNMATCHED_ROUTE
+
+
+class InstrumentationMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        key = (scope["method"], _route_template(scope))
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+        registry.start(key)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            registry.finish(key, status, time.perf_counter() - start, stats)
+            current_request.reset(token)
+
+
+def instrument_engine(sync_engine):
+    """Attribute statements run on ``sync_engine`` to the current request."""
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        started_at = conn.info["query_started_at"].pop()
+        stats = current_request.get()
+        if stats is not None:
+            stats.sql_statements += 1
+            stats.sql_seconds += time.perf_counter() - started_at
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        # after_cursor_execute is skipped for failed statements
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started_at"):
+            conn.info["query_started_at"].pop()
+
+
+def render_metrics(extra_lines=()) -> str:
+    return "\n".join(registry.render() + list(extra_lines)) + "\n"
@@ -0,0 +1,245 @@
+"""Live dashboard push over server-sent events.
+
+Control-room screens subscribe to ``GET /api/v1/dashboard/stream`` instead
+of polling ``/dashboard/stats``. Each worker keeps the dashboard totals in
+memory: they are loaded when the first screen subscribes, then moved by
+every harvest and plantation write the worker commits, and each change
+is broadcast to all subscribers as a ``delta`` event.
+
+Writes committed by other workers and the change of day are picked up by
+a resync every ``LIVE_DASHBOARD_RESYNC_SECONDS`` while screens are
+subscribed: one stats query per worker however many screens are
+connected, followed by a ``snapshot`` event when the totals moved.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import date, datetime
+from typing import Iterable, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models import Block, HarvestDailyRollup, Plantation
+import fast_json
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LIVE_DASHBOARD_RESYNC_SECONDS = float(os.getenv("LIVE_DASHBOARD_RESYNC_SECONDS", 30))
+LIVE_DASHBOARD_KEEPALIVE_SECONDS = float(
+    os.getenv("LIVE_DASHBOARD_KEEPALIVE_SECONDS", 15)
+)
+# Events buffered per screen; a screen that falls further behind gets a
+# fresh snapshot instead
+SUBSCRIBER_QUEUE_SIZE = 100
+
+KEEPALIVE = b": keepalive\n\n"
+
+
+async def load_totals(db: AsyncSession, today: date) -> dict:
+    """The DashboardStats totals for ``today``, from the daily rollup."""
+    total_plantations = await db.scalar(select(func.count()).select_from(Plantation))
+    total_blocks = await db.scalar(select(func.count()).select_from(Block))
+
+    first_day_of_month = today.replace(day=1)
+    result = await db.execute(
+        select(
+            func.sum(
+                case(
+                    (HarvestDailyRollup.day == today, HarvestDailyRollup.tonnes),
+                    else_=0,
+                )
+            ),
+            func.sum(HarvestDailyRollup.tonnes),
+        ).where(HarvestDailyRollup.day >= first_day_of_month)
+    )
+    total_harvest_today, total_harvest_this_month = result.one()
+    return {
+        "total_plantations": total_plantations,
+        "total_blocks": total_blocks,
+        "total_harvest_today": float(total_harvest_today or 0),
+        "total_harvest_this_month": float(total_harvest_this_month or 0),
+    }
+
+
+def _event(name: str, data: dict) -> bytes:
+    return b"event: " + name.encode() + b"\ndata: " + fast_json.dumps(data) + b"\n\n"
+
+
+class DashboardFeed:
+    """Running dashboard totals of this worker and its subscribed screens."""
+
+    def __init__(
+        self,
+        resync_seconds: float = LIVE_DASHBOARD_RESYNC_SECONDS,
+        keepalive_seconds: float = LIVE_DASHBOARD_KEEPALIVE_SECONDS,
+    ):
+        self.resync_seconds = resync_seconds
+        self.keepalive_seconds = keepalive_seconds
+        self.totals: Optional[dict] = None
+        self.day: Optional[date] = None
+        # Number of changes applied; subscribers can spot a missed delta
+        self.seq = 0
+        self.resyncs = 0
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._wake: Optional[asyncio.Event] = None
+        self._loading: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    async def ensure_loaded(self, db: Optional[AsyncSession] = None):
+        """Load the totals unless they are current; uses ``db`` if given."""
+        if self._loading is None:
+            self._loading = asyncio.Lock()
+        # Screens reconnecting together after a restart share one load
+        async with self._loading:
+            today = date.today()
+            if self.totals is not None and self.day == today:
+                return
+            if db is None:
+                async with AsyncSessionLocal() as db:
+                    totals = await load_totals(db, today)
+            else:
+                totals = await load_totals(db, today)
+            self.totals, self.day = totals, today
+            self.seq += 1
+            if self._subscribers:
+                self._publish(self._snapshot())
+
+    async def events(self):
+        """Server-sent event stream of one screen: a snapshot, then deltas
+        and snapshots as they happen, with keep-alive comments between."""
+        await self.ensure_loaded()
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        try:
+            yield self._snapshot()
+            while True:
+                try:
+                    message = await asyncio.wait_for(
+                        queue.get(), timeout=self.keepalive_seconds
+                    )
+                except asyncio.TimeoutError:
+                    yield KEEPALIVE
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            self._subscribers.discard(queue)
+
+    def record_harvests(self, harvests: Iterable[Tuple[datetime, float]]):
+        """Add committed harvests, as (date, tonnes) pairs, to the totals."""
+        if self.totals is None:
+            return
+        if self.day != date.today():
+            # Today's total starts over; let the resync reload everything
+            if self._wake is not None:
+                self._wake.set()
+            return
+        first_day_of_month = self.day.replace(day=1)
+        today = month = 0.0
+        for harvest_date, tonnes in harvests:
+            day = harvest_date.date()
+            if day == self.day:
+                today += tonnes or 0
+            if day >= first_day_of_month:
+                month += tonnes or 0
+        self._apply(total_harvest_today=today, total_harvest_this_month=month)
+
+    def record_plantations(self, change: int):
+        """Count plantations created (+n) or deleted (-n) and committed."""
+        if self.totals is not None:
+            self._apply(total_plantations=change)
+
+    def _apply(self, **changes):
+        changes = {name: value for name, value in changes.items() if value}
+        if not changes:
+            return
+        for name, value in changes.items():
+            self.totals[name] += value
+        self.seq += 1
+        self._publish(_event("delta", {"seq": self.seq, **changes}))
+
+    def _snapshot(self) -> bytes:
+        return _event("snapshot", {"seq": self.seq, **self.totals})
+
+    def _publish(self, message: Optional[bytes]):
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Too far behind for deltas to help; start it over
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(message and self._snapshot())
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        # End the open streams, so shutdown doesn't wait for the screens
+        self._publish(None)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.resync_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.resync()
+            except Exception:
+                logger.exception("Resyncing the live dashboard totals failed")
+
+    async def resync(self):
+        """Reload the totals and send a snapshot when they moved."""
+        if not self._subscribers:
+            # Nobody watches; the next subscriber loads fresh totals
+            self.totals = None
+            return
+        seq, today = self.seq, date.today()
+        async with AsyncSessionLocal() as db:
+            totals = await load_totals(db, today)
+        self.resyncs += 1
+        if self.seq != seq:
+            # A write landed meanwhile; its delta may be missing from
+            # ``totals``, so try again next time
+            return
+        if self.day == today and all(
+            round(totals[name], 6) == round(value, 6)
+            for name, value in self.totals.items()
+        ):
+            return
+        self.totals, self.day = totals, today
+        self.seq += 1
+        self._publish(self._snapshot())
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "seq": self.seq,
+            "resyncs": self.resyncs,
+            "totals": self.totals,
+        }
+
+
+dashboard_feed = DashboardFeed()
@@ -0,0 +1,93 @@
+"""Event-loop lag monitor.
+
+A background task asks to wake up every ``interval`` seconds and records
+how late it actually woke up. Any blocking call on the loop (a sync DB
+query inside an ``async def``, heavy CPU work, ...) shows up directly as
+lag here.
+"""
+
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOOP_MONITOR_INTERVAL = float(os.getenv("EVENT_LOOP_MONITOR_INTERVAL", 0.25))
+EVENT_LOOP_LAG_WARN_MS = float(os.getenv("EVENT_LOOP_LAG_WARN_MS", 100))
+
+
+class EventLoopMonitor:
+    def __init__(
+        self,
+        interval: float = EVENT_LOOP_MONITOR_INTERVAL,
+        warn_ms: float = EVENT_LOOP_LAG_WARN_MS,
+        window: int = 1200,
+    ):
+        self.interval = interval
+        self.warn_ms = warn_ms
+        self.samples = 0
+        self.slow_samples = 0
+        self.total_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.last_lag_ms = 0.0
+        self._recent = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.record(max(loop.time() - scheduled, 0.0) * 1000)
+
+    def record(self, lag_ms: float):
+        self.samples += 1
+        self.total_lag_ms += lag_ms
+        self.last_lag_ms = lag_ms
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        self._recent.append(lag_ms)
+        if lag_ms >= self.warn_ms:
+            self.slow_samples += 1
+            logger.warning("Event loop blocked for %.1f ms", lag_ms)
+
+    def stats(self) -> dict:
+        recent = sorted(self._recent)
+
+        def percentile(p):
+            if not recent:
+                return 0.0
+            return recent[min(len(recent) - 1, int(p * len(recent)))]
+
+        return {
+            "interval_seconds": self.interval,
+            "samples": self.samples,
+            "slow_samples": self.slow_samples,
+            "warn_ms": self.warn_ms,
+            "last_lag_ms": self.last_lag_ms,
+            "max_lag_ms": self.max_lag_ms,
+            "mean_lag_ms": self.total_lag_ms / self.samples if self.samples else 0.0,
+            "recent_p50_ms": percentile(0.50),
+            "recent_p99_ms": percentile(0.99),
+        }
+
+
+loop_monitor = EventLoopMonitor()
@@ -1,15 +1,30 @@
+import startup  # first, so the startup time covers every import below
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine
-from database import Base, engine
-from routers import auth, plantations, harvests, dashboard
+from database import async_engine, check_dialect
+from routers import (
+    auth,
+    plantations,
+    harvests,
+    dashboard,
+    analytics,
+    metrics,
+    sync,
+)
+from loop_monitor import loop_monitor
+from batch_trace import batch_code_filter
+from live_dashboard import dashboard_feed
+from harvest_queue import harvest_queue
+from instrumentation import InstrumentationMiddleware
+from query_budget import QUERY_BUDGET_MODE, QueryBudgetMiddleware
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# The schema is managed by migrations (python migrate.py), run once per
+# deploy; workers don't connect to the database until the first request
 
 app = FastAPI(
     title="FAP Agri - Farm Management System",
@@ -29,8 +44,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Per-route latency, status and SQL metrics, served at /metrics
+app.add_middleware(InstrumentationMiddleware)
+
+# Dev/CI guard against N+1 queries, see query_budget.py
+if QUERY_BUDGET_MODE in ("warn", "raise"):
+    app.add_middleware(QueryBudgetMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["Authentication"])
 app.include_router(
@@ -38,6 +61,65 @@ app.include_router(
 )
 app.include_router(harvests.router, prefix="/api/v1/harvests", tags=["Harvests"])
 app.include_router(dashboard.router, prefix="/api/v1/dashboard", tags=["Dashboard"])
+app.include_router(analytics.router, prefix="/api/v1/analytics", tags=["Analytics"])
+app.include_router(sync.router, prefix="/api/v1/sync", tags=["Sync"])
+app.include_router(metrics.router, prefix="/metrics", tags=["Metrics"])
+
+
+@app.on_event("startup")
+async def check_database_dialect():
+    check_dialect(async_engine)
+
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    loop_monitor.start()
+
+
+@app.on_event("shutdown")
+async def stop_loop_monitor():
+    await loop_monitor.stop()
+
+
+@app.on_event("startup")
+async def start_batch_code_filter():
+    batch_code_filter.start()
+
+
+@app.on_event("shutdown")
+async def stop_batch_code_filter():
+    await batch_code_filter.stop()
+
+
+@app.on_event("startup")
+async def start_dashboard_feed():
+    dashboard_feed.start()
+
+
+@app.on_event("shutdown")
+async def stop_dashboard_feed():
+    await dashboard_feed.stop()
+
+
+@app.on_event("startup")
+async def start_harvest_queue():
+    harvest_queue.start()
+
+
+@app.on_event("shutdown")
+async def stop_harvest_queue():
+    await harvest_queue.stop()
+
+
+# Registered last, so it runs after the other startup handlers
+@app.on_event("startup")
+async def record_startup_time():
+    startup.finished()
+
+
+@app.on_event("shutdown")
+async def close_db_pool():
+    await async_engine.dispose()
 
 
 @app.get("/")
@@ -0,0 +1,156 @@
+"""Versioned schema migrations, applied once per deploy before the API
+starts. The API itself never creates or alters tables.
+
+    python migrate.py            apply pending migrations
+    python migrate.py --status   list applied and pending versions
+    python migrate.py --check    exit 1 when migrations are pending or the
+                                 database lacks a table, column or index
+                                 declared in models.py
+
+Each migration is a ``migrations/NNNN_name.py`` module with an
+``upgrade(conn)`` function. Pending migrations run in version order, each
+in its own transaction together with its row in ``schema_migrations``;
+on PostgreSQL an advisory lock keeps concurrent deploys from running them
+twice. A change to models.py needs a new migration; never edit one that
+has been released.
+"""
+
+import argparse
+import importlib
+import pkgutil
+import sys
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, select, text
+
+import migrations
+
+MIGRATIONS_TABLE = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", String(100), primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# Arbitrary application-wide key of the PostgreSQL advisory lock
+LOCK_KEY = 4_172_201
+
+
+def available() -> list:
+    """[(version, module)] of every migration, oldest first."""
+    names = sorted(
+        module.name
+        for module in pkgutil.iter_modules(migrations.__path__)
+        if module.name[:4].isdigit()
+    )
+    return [(name, importlib.import_module(f"migrations.{name}")) for name in names]
+
+
+def applied_versions(conn) -> set:
+    if not inspect(conn).has_table(MIGRATIONS_TABLE.name):
+        return set()
+    return set(conn.scalars(select(MIGRATIONS_TABLE.c.version)))
+
+
+def pending(engine) -> list:
+    with engine.connect() as conn:
+        done = applied_versions(conn)
+    return [version for version, _ in available() if version not in done]
+
+
+def upgrade(engine) -> list:
+    """Apply the pending migrations; returns their versions."""
+    postgres = engine.dialect.name == "postgresql"
+    with engine.connect() as lock:
+        if postgres:
+            lock.execute(text("SELECT pg_advisory_lock(:key)"), {"key": LOCK_KEY})
+        try:
+            with engine.begin() as conn:
+                MIGRATIONS_TABLE.create(conn, checkfirst=True)
+                done = applied_versions(conn)
+            applied = []
+            for version, module in available():
+                if version in done:
+                    continue
+                with engine.begin() as conn:
+                    module.upgrade(conn)
+                    conn.execute(
+                        MIGRATIONS_TABLE.insert().values(
+                            version=version, applied_at=datetime.utcnow()
+                        )
+                    )
+                applied.append(version)
+            return applied
+        finally:
+            if postgres:
+                lock.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY})
+                lock.commit()
+
+
+def drift(engine) -> list:
+    """Tables, columns and indexes of models.py missing from the database."""
+    from models import Base
+
+    missing = []
+    with engine.connect() as conn:
+        inspector = inspect(conn)
+        tables = set(inspector.get_table_names())
+        for table in Base.metadata.sorted_tables:
+            if table.name not in tables:
+                missing.append(f"table {table.name}")
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            missing += [
+                f"column {table.name}.{column.name}"
+                for column in table.columns
+                if column.name not in columns
+            ]
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            missing += [
+                f"index {index.name}"
+                for index in table.indexes
+                if index.name not in indexes
+            ]
+    return missing
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--status", action="store_true")
+    group.add_argument("--check", action="store_true")
+    args = parser.parse_args()
+
+    from database import check_dialect, engine
+
+    check_dialect(engine)
+
+    if args.status:
+        with engine.connect() as conn:
+            done = applied_versions(conn)
+        for version, _ in available():
+            print(f"{'applied' if version in done else 'pending'}  {version}")
+        return 0
+    if args.check:
+        problems = [f"pending migration {version}" for version in pending(engine)]
+        problems += drift(engine)
+        for problem in problems:
+            print(f"❌ {problem}")
+        if not problems:
+            print("✅ Database schema is up to date")
+        return 1 if problems else 0
+
+    try:
+        applied = upgrade(engine)
+    except Exception as e:
+        print(f"❌ Error applying migrations: {e}")
+        return 1
+    for version in applied:
+        print(f"✅ Applied {version}")
+    if not applied:
+        print("✅ Database schema is up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""Baseline schema: every table, column and index the API used before
+migrations were introduced.
+
+The definitions are frozen here rather than taken from models.py, so this
+migration keeps producing the same schema when the models change later.
+Databases that were created by ``create_all`` under earlier releases are
+brought up to the same state: missing tables are created and columns and
+indexes added since then (geohash, rollup and pagination indexes) are
+added in place.
+"""
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    inspect,
+    text,
+)
+
+import geo
+
+metadata = MetaData()
+
+Table(
+    "plantations",
+    metadata,
+    Column("id", String, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("location_lat", Float),
+    Column("location_lng", Float),
+    Column("geohash", String(12)),
+    Column("area_ha", Float),
+    Column("address", Text),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+    Index("ix_plantations_created_at_id", "created_at", "id"),
+    Index("ix_plantations_geohash", "geohash"),
+)
+
+Table(
+    "blocks",
+    metadata,
+    Column("id", String, primary_key=True),
+    Column("plantation_id", String, ForeignKey("plantations.id")),
+    Column("name", String(100), nullable=False),
+    Column("area_ha", Float),
+    Column("planting_year", Integer),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+    Index("ix_blocks_plantation_id", "plantation_id"),
+)
+
+Table(
+    "employees",
+    metadata,
+    Column("id", String, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("employee_code", String(50), unique=True),
+    Column("position", String(50)),
+    Column("phone", String(20)),
+    Column("is_active", Boolean),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+)
+
+Table(
+    "harvest_records",
+    metadata,
+    Column("id", String, primary_key=True),
+    Column("block_id", String, ForeignKey("blocks.id")),
+    Column("harvester_id", String, ForeignKey("employees.id")),
+    Column("date", DateTime, nullable=False),
+    Column("tonnes_fresh_fruit_bunches", Float),
+    Column("batch_code", String(100), unique=True),
+    Column("geo_lat", Float),
+    Column("geo_lng", Float),
+    Column("geohash", String(12)),
+    Column("notes", Text),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+    Index("ix_harvest_records_block_id_date", "block_id", "date"),
+    Index("ix_harvest_records_harvester_id_date", "harvester_id", "date"),
+    Index("ix_harvest_records_date_id", "date", "id"),
+    Index("ix_harvest_records_updated_at", "updated_at"),
+    Index(
+        "ix_harvest_records_geohash",
+        "geohash",
+        "geo_lat",
+        "geo_lng",
+        "tonnes_fresh_fruit_bunches",
+    ),
+)
+
+Table(
+    "harvest_daily_rollup",
+    metadata,
+    Column("day", Date, primary_key=True),
+    Column("block_id", String, ForeignKey("blocks.id"), primary_key=True),
+    Column("tonnes", Float, nullable=False),
+    Column("record_count", Integer, nullable=False),
+    Column("updated_at", DateTime),
+    Index("ix_harvest_daily_rollup_block_id_day", "block_id", "day"),
+    Index("ix_harvest_daily_rollup_updated_at", "updated_at"),
+)
+
+Table(
+    "harvest_tile_rollup",
+    metadata,
+    Column("cell", String(12), primary_key=True),
+    Column("day", Date, primary_key=True),
+    Column("tonnes", Float, nullable=False),
+    Column("record_count", Integer, nullable=False),
+    Column("lat_sum", Float, nullable=False),
+    Column("lng_sum", Float, nullable=False),
+    Column("updated_at", DateTime),
+)
+
+Table(
+    "users",
+    metadata,
+    Column("id", String, primary_key=True),
+    Column("username", String(50), unique=True, nullable=False),
+    Column("email", String(100), unique=True, nullable=False),
+    Column("hashed_password", String(255), nullable=False),
+    Column("full_name", String(100)),
+    Column("role", String(20)),
+    Column("is_active", Boolean),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+    Index("ix_users_created_at_id", "created_at", "id"),
+)
+
+
+def upgrade(conn):
+    inspector = inspect(conn)
+    existing = set(inspector.get_table_names())
+    for table in metadata.sorted_tables:
+        if table.name not in existing:
+            table.create(conn)
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                # Only nullable columns were added after a table shipped
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(
+                    text(
+                        f"ALTER TABLE {table.name} "
+                        f"ADD COLUMN {column.name} {column_type}"
+                    )
+                )
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+    if geo.has_postgis(conn):
+        for table_name in geo.POSTGIS_INDEXES:
+            conn.execute(text(geo.postgis_index_sql(table_name)))
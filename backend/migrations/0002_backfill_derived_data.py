@@ -0,0 +1,164 @@
+"""Fill derived data for databases that predate it: geohash values of
+rows with coordinates and the daily and tile rollups. A no-op on a fresh
+database. Replaces the former backfill_geohash.py script.
+
+Like the baseline, the tables and the rollup queries are frozen here
+rather than taken from models.py and rollup.py.
+"""
+
+from sqlalchemy import (
+    Column,
+    Date,
+    DateTime,
+    Float,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    bindparam,
+    delete,
+    func,
+    insert,
+    select,
+    update,
+)
+
+import geo
+
+BATCH_SIZE = 10_000
+GEOHASH_PRECISION = 9
+TILE_ROLLUP_PRECISION = 5
+
+metadata = MetaData()
+
+plantations = Table(
+    "plantations",
+    metadata,
+    Column("id", String, primary_key=True),
+    Column("location_lat", Float),
+    Column("location_lng", Float),
+    Column("geohash", String(12)),
+)
+
+harvest_records = Table(
+    "harvest_records",
+    metadata,
+    Column("id", String, primary_key=True),
+    Column("block_id", String),
+    Column("date", DateTime),
+    Column("tonnes_fresh_fruit_bunches", Float),
+    Column("geo_lat", Float),
+    Column("geo_lng", Float),
+    Column("geohash", String(12)),
+)
+
+daily_rollup = Table(
+    "harvest_daily_rollup",
+    metadata,
+    Column("day", Date, primary_key=True),
+    Column("block_id", String, primary_key=True),
+    Column("tonnes", Float),
+    Column("record_count", Integer),
+    Column("updated_at", DateTime),
+)
+
+tile_rollup = Table(
+    "harvest_tile_rollup",
+    metadata,
+    Column("cell", String(12), primary_key=True),
+    Column("day", Date, primary_key=True),
+    Column("tonnes", Float),
+    Column("record_count", Integer),
+    Column("lat_sum", Float),
+    Column("lng_sum", Float),
+    Column("updated_at", DateTime),
+)
+
+
+def _backfill_geohash(conn, table, lat_name: str, lng_name: str):
+    lat_column, lng_column = table.c[lat_name], table.c[lng_name]
+    pending = (
+        select(table.c.id, lat_column, lng_column)
+        .where(table.c.geohash.is_(None))
+        .where(lat_column.is_not(None), lng_column.is_not(None))
+        .limit(BATCH_SIZE)
+    )
+    fill = (
+        update(table)
+        .where(table.c.id == bindparam("row_id"))
+        .values(geohash=bindparam("value"))
+    )
+    while rows := conn.execute(pending).all():
+        conn.execute(
+            fill,
+            [
+                {"row_id": row_id, "value": geo.encode(lat, lng, GEOHASH_PRECISION)}
+                for row_id, lat, lng in rows
+            ],
+        )
+
+
+def _rebuild_daily(conn):
+    day = func.date(harvest_records.c.date)
+    source = select(
+        day,
+        harvest_records.c.block_id,
+        func.coalesce(func.sum(harvest_records.c.tonnes_fresh_fruit_bunches), 0),
+        func.count(harvest_records.c.id),
+        func.now(),
+    ).group_by(day, harvest_records.c.block_id)
+    conn.execute(delete(daily_rollup))
+    conn.execute(
+        insert(daily_rollup).from_select(
+            ["day", "block_id", "tonnes", "record_count", "updated_at"], source
+        )
+    )
+
+
+def _rebuild_tiles(conn):
+    day = func.date(harvest_records.c.date)
+    cell = func.substr(harvest_records.c.geohash, 1, TILE_ROLLUP_PRECISION)
+    source = (
+        select(
+            cell,
+            day,
+            func.coalesce(func.sum(harvest_records.c.tonnes_fresh_fruit_bunches), 0),
+            func.count(harvest_records.c.id),
+            func.sum(harvest_records.c.geo_lat),
+            func.sum(harvest_records.c.geo_lng),
+            func.now(),
+        )
+        .where(harvest_records.c.geohash.is_not(None))
+        .group_by(cell, day)
+    )
+    conn.execute(delete(tile_rollup))
+    conn.execute(
+        insert(tile_rollup).from_select(
+            [
+                "cell",
+                "day",
+                "tonnes",
+                "record_count",
+                "lat_sum",
+                "lng_sum",
+                "updated_at",
+            ],
+            source,
+        )
+    )
+
+
+def _is_empty(conn, table) -> bool:
+    return conn.execute(select(table).limit(1)).first() is None
+
+
+def upgrade(conn):
+    _backfill_geohash(conn, plantations, "location_lat", "location_lng")
+    _backfill_geohash(conn, harvest_records, "geo_lat", "geo_lng")
+    if _is_empty(conn, harvest_records):
+        return
+    if _is_empty(conn, daily_rollup):
+        _rebuild_daily(conn)
+        _rebuild_tiles(conn)
+    elif _is_empty(conn, tile_rollup):
+        _rebuild_tiles(conn)
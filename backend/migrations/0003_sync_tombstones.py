@@ -0,0 +1,53 @@
+"""Delta sync (see sync.py): the tombstone table of deleted rows and
+(updated_at, id) indexes for reading each synced table in change order.
+The harvest index replaces the plain ``updated_at`` one, which it covers.
+"""
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    inspect,
+    text,
+)
+
+metadata = MetaData()
+
+tombstones = Table(
+    "sync_tombstones",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("entity", String(20), nullable=False),
+    Column("entity_id", String, nullable=False),
+    Column("deleted_at", DateTime, nullable=False),
+    Index("ix_sync_tombstones_deleted_at_id", "deleted_at", "id"),
+)
+
+# (table, index name)
+CHANGE_ORDER_INDEXES = [
+    ("plantations", "ix_plantations_updated_at_id"),
+    ("blocks", "ix_blocks_updated_at_id"),
+    ("employees", "ix_employees_updated_at_id"),
+    ("harvest_records", "ix_harvest_records_updated_at_id"),
+]
+
+
+def upgrade(conn):
+    tombstones.create(conn, checkfirst=True)
+    synced = MetaData()
+    for table_name, index_name in CHANGE_ORDER_INDEXES:
+        table = Table(
+            table_name,
+            synced,
+            Column("id", String, primary_key=True),
+            Column("updated_at", DateTime),
+        )
+        Index(index_name, table.c.updated_at, table.c.id).create(conn, checkfirst=True)
+
+    indexes = {index["name"] for index in inspect(conn).get_indexes("harvest_records")}
+    if "ix_harvest_records_updated_at" in indexes:
+        conn.execute(text("DROP INDEX ix_harvest_records_updated_at"))
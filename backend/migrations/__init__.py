@@ -0,0 +1 @@
+"""Versioned schema migrations, applied by ``migrate.py``."""
@@ -3,26 +3,42 @@ from sqlalchemy import (
     Integer,
     String,
     Float,
+    Date,
     DateTime,
     ForeignKey,
     Text,
     Boolean,
+    Index,
 )
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 import uuid
 
+import geo
+
+# The one declarative base of the app; the schema itself is created and
+# changed by migrations (see migrate.py)
 Base = declarative_base()
 
 
 class Plantation(Base):
     __tablename__ = "plantations"
+    __table_args__ = (
+        # Keyset pagination order of read_plantations
+        Index("ix_plantations_created_at_id", "created_at", "id"),
+        # Bounding box and radius searches (see geo.py)
+        Index("ix_plantations_geohash", "geohash"),
+        # Rows changed since a client's last delta sync (see sync.py)
+        Index("ix_plantations_updated_at_id", "updated_at", "id"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     name = Column(String(100), nullable=False)
     location_lat = Column(Float)
     location_lng = Column(Float)
+    geohash = Column(
+        String(12), default=geo.geohash_default("location_lat", "location_lng")
+    )
     area_ha = Column(Float)
     address = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -33,6 +49,10 @@ class Plantation(Base):
 
 class Block(Base):
     __tablename__ = "blocks"
+    __table_args__ = (
+        Index("ix_blocks_plantation_id", "plantation_id"),
+        Index("ix_blocks_updated_at_id", "updated_at", "id"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     plantation_id = Column(String, ForeignKey("plantations.id"))
@@ -48,6 +68,7 @@ class Block(Base):
 
 class Employee(Base):
     __tablename__ = "employees"
+    __table_args__ = (Index("ix_employees_updated_at_id", "updated_at", "id"),)
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     name = Column(String(100), nullable=False)
@@ -63,6 +84,25 @@ class Employee(Base):
 
 class HarvestRecord(Base):
     __tablename__ = "harvest_records"
+    __table_args__ = (
+        # Per-block listings and latest harvests of a plantation's blocks
+        Index("ix_harvest_records_block_id_date", "block_id", "date"),
+        Index("ix_harvest_records_harvester_id_date", "harvester_id", "date"),
+        # Date ranges, export order and keyset pagination of read_harvests
+        Index("ix_harvest_records_date_id", "date", "id"),
+        # Records written since a point in time (trace filter refresh,
+        # delta sync)
+        Index("ix_harvest_records_updated_at_id", "updated_at", "id"),
+        # Bounding box, radius and map tile queries (see geo.py); covers
+        # the box test and tile sums without visiting the table
+        Index(
+            "ix_harvest_records_geohash",
+            "geohash",
+            "geo_lat",
+            "geo_lng",
+            "tonnes_fresh_fruit_bunches",
+        ),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     block_id = Column(String, ForeignKey("blocks.id"))
@@ -72,6 +112,7 @@ class HarvestRecord(Base):
     batch_code = Column(String(100), unique=True)
     geo_lat = Column(Float)
     geo_lng = Column(Float)
+    geohash = Column(String(12), default=geo.geohash_default("geo_lat", "geo_lng"))
     notes = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -80,8 +121,58 @@ class HarvestRecord(Base):
     harvester = relationship("Employee", back_populates="harvest_records")
 
 
+class HarvestDailyRollup(Base):
+    """Harvest totals per block and day, kept in step with harvest_records
+    by the write path (see rollup.py) so dashboards never scan raw rows."""
+
+    __tablename__ = "harvest_daily_rollup"
+    __table_args__ = (
+        # The primary key serves day ranges; this one serves per-block joins
+        Index("ix_harvest_daily_rollup_block_id_day", "block_id", "day"),
+        # max(updated_at) is the dashboards' data version (conditional.py)
+        Index("ix_harvest_daily_rollup_updated_at", "updated_at"),
+    )
+
+    day = Column(Date, primary_key=True)
+    block_id = Column(String, ForeignKey("blocks.id"), primary_key=True)
+    tonnes = Column(Float, nullable=False, default=0)
+    record_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class HarvestTileRollup(Base):
+    """Harvest totals per geohash cell (``geo.TILE_ROLLUP_PRECISION``) and
+    day, kept in step with harvest_records like the daily rollup; coarse
+    map tiles are summed from here."""
+
+    __tablename__ = "harvest_tile_rollup"
+
+    cell = Column(String(12), primary_key=True)
+    day = Column(Date, primary_key=True)
+    tonnes = Column(Float, nullable=False, default=0)
+    record_count = Column(Integer, nullable=False, default=0)
+    # Coordinate sums, so tiles can be placed at the mean harvest location
+    lat_sum = Column(Float, nullable=False, default=0)
+    lng_sum = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class SyncTombstone(Base):
+    """Deleted plantations, blocks, employees and harvest records, kept so
+    offline clients drop them on their next delta sync (see sync.py)."""
+
+    __tablename__ = "sync_tombstones"
+    __table_args__ = (Index("ix_sync_tombstones_deleted_at_id", "deleted_at", "id"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    entity = Column(String(20), nullable=False)
+    entity_id = Column(String, nullable=False)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (Index("ix_users_created_at_id", "created_at", "id"),)
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     username = Column(String(50), unique=True, nullable=False)
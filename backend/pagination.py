@@ -0,0 +1,96 @@
+"""Keyset (cursor) pagination for list endpoints.
+
+Offset pagination makes the database walk and discard every earlier row,
+so deep pages get slower the further a client reads. A cursor instead
+remembers the sort key of the last row served and the next page starts
+right after it, which an index on the sort columns can seek to directly.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Sequence
+
+from fastapi import HTTPException, Response
+from sqlalchemy import and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: Sequence) -> str:
+    payload = [
+        value.isoformat() if isinstance(value, datetime) else value for value in values
+    ]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Sequence) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(payload, list) or len(payload) != len(columns):
+            raise ValueError("cursor does not match sort key")
+        return [
+            (
+                datetime.fromisoformat(value)
+                if value is not None and column.type.python_type is datetime
+                else value
+            )
+            for column, value in zip(columns, payload)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def after(columns: Sequence, values: Sequence, descending: bool = False):
+    """Row-value comparison ``(c1, c2, ...) > (v1, v2, ...)`` spelled out
+    with AND/OR so it works on every backend."""
+    column, value = columns[0], values[0]
+    beyond = column < value if descending else column > value
+    if len(columns) == 1:
+        return beyond
+    return or_(
+        beyond, and_(column == value, after(columns[1:], values[1:], descending))
+    )
+
+
+async def paginate(
+    db: AsyncSession,
+    stmt,
+    response: Response,
+    columns: Sequence,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    descending: bool = False,
+    as_rows: bool = False,
+):
+    """Return one page of the entities selected by ``stmt``, ordered by
+    ``columns``.
+
+    ``columns`` must end with a unique column so the order is total. When
+    a further page exists its cursor is sent in the ``X-Next-Cursor``
+    header. ``skip`` is only honoured when no cursor is given. With
+    ``as_rows`` the statement selects columns (including ``columns``) and
+    the page is returned as rows rather than entities.
+    """
+    stmt = stmt.order_by(
+        *[column.desc() if descending else column.asc() for column in columns]
+    )
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        stmt = stmt.where(after(columns, values, descending))
+    elif skip:
+        stmt = stmt.offset(skip)
+
+    result = await db.execute(stmt.limit(limit + 1))
+    rows = result.all() if as_rows else result.scalars().all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        if rows:
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+                [getattr(rows[-1], column.key) for column in columns]
+            )
+    return rows
@@ -0,0 +1,105 @@
+"""Connection pool instrumentation for the API engine.
+
+Counters are fed by SQLAlchemy pool events (connect, checkout, checkin,
+invalidate). How long a request waits for a connection is not visible
+through events, so ``InstrumentedQueuePool`` times ``_do_get`` itself and
+counts checkout timeouts.
+"""
+
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.held_seconds_total = 0.0
+        self.held_seconds_max = 0.0
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def record_held(self, seconds: float):
+        with self._lock:
+            self.held_seconds_total += seconds
+            self.held_seconds_max = max(self.held_seconds_max, seconds)
+
+    def stats(self, pool) -> dict:
+        stats = {
+            "pool_class": type(pool).__name__,
+            "connects": self.connects,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "invalidations": self.invalidations,
+            "checkout_timeouts": self.timeouts,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_max": self.wait_seconds_max,
+            "wait_seconds_avg": (
+                self.wait_seconds_total / self.checkouts if self.checkouts else 0.0
+            ),
+            "held_seconds_total": self.held_seconds_total,
+            "held_seconds_max": self.held_seconds_max,
+        }
+        if isinstance(pool, AsyncAdaptedQueuePool):
+            stats.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                idle=pool.checkedin(),
+                overflow=max(pool.overflow(), 0),
+                max_overflow=pool._max_overflow,
+                timeout_seconds=pool.timeout(),
+            )
+        return stats
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records checkout wait time and timeouts."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            pool_metrics.record_wait(time.perf_counter() - start)
+
+
+def instrument_pool(pool):
+    """Attach the event listeners that feed ``pool_metrics``."""
+
+    @event.listens_for(pool, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        pool_metrics.connects += 1
+
+    @event.listens_for(pool, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_metrics.checkouts += 1
+        connection_record.info["checked_out_at"] = time.perf_counter()
+
+    @event.listens_for(pool, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        pool_metrics.checkins += 1
+        checked_out_at = connection_record.info.pop("checked_out_at", None)
+        if checked_out_at is not None:
+            pool_metrics.record_held(time.perf_counter() - checked_out_at)
+
+    @event.listens_for(pool, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        pool_metrics.invalidations += 1
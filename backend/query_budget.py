@@ -0,0 +1,182 @@
+"""Query budgets: catch N+1 queries before they reach production.
+
+Every statement the API engine sends is recorded by its *shape*: the SQL
+with bound values and ``IN (...)``/``VALUES`` lists collapsed, so a lazy
+load issued once per row shows up as the same SELECT shape repeated.
+
+Two ways to use it:
+
+``query_budget(...)``
+    Context manager for tests and scripts. Counts every statement run on
+    the API engine inside the block (including requests served by a
+    ``TestClient``) and raises ``QueryBudgetExceeded`` on exit::
+
+        with query_budget(max_statements=3):
+            client.get("/api/v1/harvests/")
+
+``QueryBudgetMiddleware``
+    Checks every request against the budget declared on its endpoint with
+    ``@statement_budget(n)`` (``QUERY_BUDGET_DEFAULT`` otherwise). Enabled by
+    ``QUERY_BUDGET_MODE=warn`` (log a warning) or ``QUERY_BUDGET_MODE=raise``
+    (raise, so the test client fails); off by default.
+"""
+
+import logging
+import os
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+
+from database import async_engine
+from instrumentation import UNMATCHED_ROUTE, match_route
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "off").lower()
+QUERY_BUDGET_DEFAULT = int(os.getenv("QUERY_BUDGET_DEFAULT", 10))
+# How often one SELECT shape may run in a request before it counts as N+1
+QUERY_BUDGET_MAX_REPEATS = int(os.getenv("QUERY_BUDGET_MAX_REPEATS", 2))
+
+_NUMBERED = re.compile(r"\$\d+|%\(\w+\)s")
+_PLACEHOLDER = r"(?:\?|%s)"
+_PLACEHOLDER_LIST = re.compile(rf"\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})*\s*\)")
+_VALUES_LIST = re.compile(r"(\(\?\))(?:\s*,\s*\(\?\))+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def statement_shape(statement: str) -> str:
+    """``statement`` with literals and placeholder lists normalised."""
+    shape = _NUMBERED.sub("?", " ".join(statement.split()))
+    shape = _STRING.sub("?", shape)
+    shape = _NUMBER.sub("?", shape)
+    shape = _PLACEHOLDER_LIST.sub("(?)", shape)
+    return _VALUES_LIST.sub(r"\1", shape)
+
+
+class QueryLog:
+    """Statement shapes recorded while a budget is active."""
+
+    def __init__(self):
+        self.shapes: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.shapes)
+
+    def repeated(self, max_repeats: int) -> dict:
+        """SELECT shapes that ran more than ``max_repeats`` times."""
+        counts = Counter(
+            shape for shape in self.shapes if shape.upper().startswith("SELECT")
+        )
+        return {shape: n for shape, n in counts.items() if n > max_repeats}
+
+    def violations(
+        self, max_statements: Optional[int], max_repeats: Optional[int]
+    ) -> List[str]:
+        problems = []
+        if max_statements is not None and self.count > max_statements:
+            problems.append(f"{self.count} statements, budget is {max_statements}")
+        if max_repeats is not None:
+            for shape, n in self.repeated(max_repeats).items():
+                problems.append(f"same statement ran {n} times: {shape}")
+        return problems
+
+
+# Logs of open query_budget() blocks; process-wide because a TestClient
+# serves requests on another thread, out of reach of a context variable
+_open_logs: List[QueryLog] = []
+_open_logs_lock = threading.Lock()
+# Log of the request being served, for the middleware
+_request_log: ContextVar[Optional[QueryLog]] = ContextVar(
+    "query_budget_request_log", default=None
+)
+
+
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    request_log = _request_log.get()
+    if request_log is None and not _open_logs:
+        return
+    shape = statement_shape(statement)
+    if request_log is not None:
+        request_log.shapes.append(shape)
+    with _open_logs_lock:
+        for log in _open_logs:
+            log.shapes.append(shape)
+
+
+@contextmanager
+def query_budget(
+    max_statements: Optional[int] = None,
+    max_repeats: Optional[int] = QUERY_BUDGET_MAX_REPEATS,
+    label: str = "block",
+):
+    """Fail when the block runs too many statements or repeats a SELECT."""
+    log = QueryLog()
+    with _open_logs_lock:
+        _open_logs.append(log)
+    try:
+        yield log
+    finally:
+        with _open_logs_lock:
+            _open_logs.remove(log)
+    problems = log.violations(max_statements, max_repeats)
+    if problems:
+        raise QueryBudgetExceeded(f"{label} over query budget: " + "; ".join(problems))
+
+
+def statement_budget(max_statements: int, max_repeats: int = QUERY_BUDGET_MAX_REPEATS):
+    """Declare how many statements one request to an endpoint may run."""
+
+    def decorate(endpoint):
+        endpoint.query_budget = (max_statements, max_repeats)
+        return endpoint
+
+    return decorate
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, app, mode: str = QUERY_BUDGET_MODE):
+        self.app = app
+        self.mode = mode
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = match_route(scope)
+        max_statements, max_repeats = getattr(
+            getattr(route, "endpoint", None),
+            "query_budget",
+            (QUERY_BUDGET_DEFAULT, QUERY_BUDGET_MAX_REPEATS),
+        )
+        log = QueryLog()
+        token = _request_log.set(log)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_log.reset(token)
+
+        problems = log.violations(max_statements, max_repeats)
+        if problems:
+            path = route.path if route is not None else UNMATCHED_ROUTE
+            message = f"{scope['method']} {path} over query budget: " + "; ".join(
+                problems
+            )
+            if self.mode == "raise":
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
@@ -0,0 +1,20 @@
+# Rebuild tabel harvest_daily_rollup dari harvest_records (backfill/repair)
+from database import SessionLocal
+from rollup import rebuild
+
+
+def rebuild_rollup():
+    db = SessionLocal()
+    try:
+        rows = rebuild(db)
+        db.commit()
+        print(f"✅ Harvest daily rollup rebuilt: {rows} rows")
+    except Exception as e:
+        print(f"❌ Error rebuilding rollup: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    rebuild_rollup()
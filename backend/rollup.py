@@ -0,0 +1,198 @@
+"""Maintenance of the ``harvest_daily_rollup`` and ``harvest_tile_rollup``
+tables.
+
+Every harvest write adds its tonnage to the (day, block_id) row in the same
+transaction, so dashboard totals are sums over days rather than over raw
+harvest records; harvests with coordinates are likewise added to their
+(geohash cell, day) row for map tiles. ``rebuild`` recomputes both tables
+from scratch for backfills and repairs.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import HarvestDailyRollup, HarvestRecord, HarvestTileRollup
+import geo
+
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+# Delta rows per upsert round trip
+UPSERT_CHUNK_SIZE = 1000
+
+
+def _field(row, name):
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def rollup_deltas(harvests: Iterable) -> list:
+    """Group harvest rows (dicts or objects) into per-(day, block) deltas."""
+    totals = defaultdict(lambda: [0.0, 0])
+    for harvest in harvests:
+        key = (_field(harvest, "date").date(), _field(harvest, "block_id"))
+        totals[key][0] += _field(harvest, "tonnes_fresh_fruit_bunches") or 0
+        totals[key][1] += 1
+
+    now = datetime.utcnow()
+    return [
+        {
+            "day": day,
+            "block_id": block_id,
+            "tonnes": tonnes,
+            "record_count": count,
+            "updated_at": now,
+        }
+        for (day, block_id), (tonnes, count) in totals.items()
+    ]
+
+
+def tile_deltas(harvests: Iterable) -> list:
+    """Group harvest rows with coordinates into per-(cell, day) deltas."""
+    totals = defaultdict(lambda: [0.0, 0, 0.0, 0.0])
+    for harvest in harvests:
+        lat, lng = _field(harvest, "geo_lat"), _field(harvest, "geo_lng")
+        cell = geo.encode(lat, lng, geo.TILE_ROLLUP_PRECISION)
+        if cell is None:
+            continue
+        total = totals[(cell, _field(harvest, "date").date())]
+        total[0] += _field(harvest, "tonnes_fresh_fruit_bunches") or 0
+        total[1] += 1
+        total[2] += lat
+        total[3] += lng
+
+    now = datetime.utcnow()
+    return [
+        {
+            "cell": cell,
+            "day": day,
+            "tonnes": tonnes,
+            "record_count": count,
+            "lat_sum": lat_sum,
+            "lng_sum": lng_sum,
+            "updated_at": now,
+        }
+        for (cell, day), (tonnes, count, lat_sum, lng_sum) in totals.items()
+    ]
+
+
+def _upsert(dialect_name: str, table, key_columns: list):
+    dialect_insert = _UPSERT_INSERTS.get(dialect_name)
+    if dialect_insert is None:
+        raise NotImplementedError(f"Rollup upsert not supported on {dialect_name}")
+
+    stmt = dialect_insert(table)
+    summed = [column.name for column in table.columns if column.name not in key_columns]
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c[name] for name in key_columns],
+        set_={
+            name: (
+                stmt.excluded[name]
+                if name == "updated_at"
+                else table.c[name] + stmt.excluded[name]
+            )
+            for name in summed
+        },
+    )
+
+
+def upsert_statement(dialect_name: str):
+    """INSERT ... ON CONFLICT statement that adds a delta row onto the
+    rollup; execute it with the list of deltas."""
+    return _upsert(dialect_name, HarvestDailyRollup.__table__, ["day", "block_id"])
+
+
+def tile_upsert_statement(dialect_name: str):
+    """Same as ``upsert_statement`` for the tile rollup."""
+    return _upsert(dialect_name, HarvestTileRollup.__table__, ["cell", "day"])
+
+
+def harvest_deltas(harvests: Iterable) -> tuple:
+    """(daily deltas, tile deltas) of harvest rows. Pure CPU work, so
+    large batches can compute them in a worker thread."""
+    harvests = list(harvests)
+    return rollup_deltas(harvests), tile_deltas(harvests)
+
+
+def apply_deltas(db: Session, deltas: tuple):
+    """Add ``harvest_deltas`` output to the rollups; the caller commits."""
+    dialect_name = db.get_bind().dialect.name
+    # executemany of one cached statement (a multi-row VALUES upsert took
+    # most of a second to compile for a 5000-row bulk load), in chunks so
+    # the event loop serves other requests in between
+    for stmt, rows in [
+        (upsert_statement(dialect_name), deltas[0]),
+        (tile_upsert_statement(dialect_name), deltas[1]),
+    ]:
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            db.execute(stmt, rows[start : start + UPSERT_CHUNK_SIZE])
+
+
+def apply_harvests(db: Session, harvests: Iterable):
+    """Add newly inserted harvests to the rollup; the caller commits."""
+    apply_deltas(db, harvest_deltas(harvests))
+
+
+def rebuild(db: Session) -> int:
+    """Recompute both rollups from harvest_records; the caller commits.
+
+    Returns the number of daily rollup rows.
+    """
+    day = func.date(HarvestRecord.date)
+    source = select(
+        day,
+        HarvestRecord.block_id,
+        func.coalesce(func.sum(HarvestRecord.tonnes_fresh_fruit_bunches), 0),
+        func.count(HarvestRecord.id),
+        func.now(),
+    ).group_by(day, HarvestRecord.block_id)
+
+    table = HarvestDailyRollup.__table__
+    db.execute(delete(table))
+    result = db.execute(
+        insert(table).from_select(
+            ["day", "block_id", "tonnes", "record_count", "updated_at"], source
+        )
+    )
+    rebuild_tiles(db)
+    return result.rowcount
+
+
+def rebuild_tiles(db: Session) -> int:
+    """Recompute the tile rollup from harvest_records; the caller commits."""
+    day = func.date(HarvestRecord.date)
+    cell = func.substr(HarvestRecord.geohash, 1, geo.TILE_ROLLUP_PRECISION)
+    source = (
+        select(
+            cell,
+            day,
+            func.coalesce(func.sum(HarvestRecord.tonnes_fresh_fruit_bunches), 0),
+            func.count(HarvestRecord.id),
+            func.sum(HarvestRecord.geo_lat),
+            func.sum(HarvestRecord.geo_lng),
+            func.now(),
+        )
+        .where(HarvestRecord.geohash.is_not(None))
+        .group_by(cell, day)
+    )
+
+    table = HarvestTileRollup.__table__
+    db.execute(delete(table))
+    result = db.execute(
+        insert(table).from_select(
+            [
+                "cell",
+                "day",
+                "tonnes",
+                "record_count",
+                "lat_sum",
+                "lng_sum",
+                "updated_at",
+            ],
+            source,
+        )
+    )
+    return result.rowcount
@@ -0,0 +1,91 @@
+from fastapi import APIRouter, Depends, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
+from datetime import date
+from typing import Optional
+
+from database import get_db
+from models import Block as BlockModel, HarvestDailyRollup as RollupModel
+from schemas import YieldAnalytics
+from auth import get_current_active_user
+from cache import dashboard_cache
+from query_budget import statement_budget
+from timeseries import date_bucket
+import analytics
+import conditional
+import fast_json
+
+router = APIRouter()
+
+
+async def _load_yield_analytics(
+    db: AsyncSession,
+    as_of: date,
+    months: int,
+    plantation_id: Optional[str],
+    limit: int,
+) -> bytes:
+    """Encoded YieldAnalytics body."""
+    first_month = analytics.window_start(as_of, months)
+    month = date_bucket(db.get_bind().dialect.name, "month", RollupModel.day)
+    monthly = (
+        select(
+            RollupModel.block_id,
+            month.label("month"),
+            func.sum(RollupModel.tonnes).label("tonnes"),
+        )
+        .where(RollupModel.day >= first_month, RollupModel.day <= as_of)
+        .group_by(RollupModel.block_id, month)
+        .subquery()
+    )
+    # Every block, with one row per month it was harvested in
+    stmt = (
+        select(
+            BlockModel.id,
+            BlockModel.name,
+            BlockModel.plantation_id,
+            BlockModel.area_ha,
+            BlockModel.planting_year,
+            monthly.c.month,
+            monthly.c.tonnes,
+        )
+        .outerjoin(monthly, monthly.c.block_id == BlockModel.id)
+        .order_by(BlockModel.id)
+    )
+    if plantation_id is not None:
+        stmt = stmt.where(BlockModel.plantation_id == plantation_id)
+
+    rows = (await db.execute(stmt)).all()
+    return fast_json.dumps(
+        analytics.yield_analytics(rows, first_month, months, as_of, limit)
+    )
+
+
+@router.get("/yield", response_model=YieldAnalytics, responses=conditional.RESPONSES)
+@statement_budget(3)
+async def get_yield_analytics(
+    request: Request,
+    response: Response,
+    as_of: Optional[date] = Query(None, alias="to"),
+    months: int = Query(24, ge=1, le=120),
+    plantation_id: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_active_user),
+):
+    """Yield per hectare, rolling 12-month estate yield, palm-age cohort
+    curves and block rankings for the ``months`` months ending at ``to``."""
+    as_of = as_of or date.today()
+    key = ("yield", as_of, months, plantation_id, limit)
+    unchanged = conditional.not_modified(
+        request,
+        response,
+        conditional.validator(*key, await conditional.data_version(db)),
+    )
+    if unchanged:
+        return unchanged
+    body = await dashboard_cache.get_or_load(
+        key,
+        lambda: _load_yield_analytics(db, as_of, months, plantation_id, limit),
+    )
+    return fast_json.response(body, response)
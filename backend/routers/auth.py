@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
-from typing import List
+from typing import List, Optional
 
 from database import get_db
 from models import User as UserModel
@@ -14,20 +15,25 @@ from auth import (
     get_current_active_user,
     ACCESS_TOKEN_EXPIRE_MINUTES,
 )
+from pagination import paginate
+from query_budget import statement_budget
+import fast_json
 
 router = APIRouter()
 
 
 @router.post("/register", response_model=User)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     # Check if user already exists
-    db_user = db.query(UserModel).filter(UserModel.username == user.username).first()
-    if db_user:
+    result = await db.execute(
+        select(UserModel).where(UserModel.username == user.username)
+    )
+    if result.scalars().first():
         raise HTTPException(status_code=400, detail="Username already registered")
 
     # Check if email already exists
-    db_user = db.query(UserModel).filter(UserModel.email == user.email).first()
-    if db_user:
+    result = await db.execute(select(UserModel).where(UserModel.email == user.email))
+    if result.scalars().first():
         raise HTTPException(status_code=400, detail="Email already registered")
 
     # Create new user
@@ -40,16 +46,17 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
         hashed_password=hashed_password,
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 
 @router.post("/login", response_model=Token)
-def login_user(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+async def login_user(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -64,16 +71,29 @@ def login_user(
 
 
 @router.get("/me", response_model=User)
-def read_users_me(current_user: User = Depends(get_current_active_user)):
+@statement_budget(1)
+async def read_users_me(current_user: User = Depends(get_current_active_user)):
     return current_user
 
 
 @router.get("/users", response_model=List[User])
-def read_users(
+@statement_budget(2)
+async def read_users(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
-    users = db.query(UserModel).offset(skip).limit(limit).all()
-    return users
+    users = await paginate(
+        db,
+        select(*fast_json.columns(UserModel, User)),
+        response,
+        (UserModel.created_at, UserModel.id),
+        cursor=cursor,
+        skip=skip,
+        limit=limit,
+        as_rows=True,
+    )
+    return fast_json.response(fast_json.records(users), response)
@@ -1,108 +1,381 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, date
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from sqlalchemy import func, select
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+from typing import List, Optional
 
 from database import get_db
 from models import (
     Plantation as PlantationModel,
     Block as BlockModel,
+    Employee as EmployeeModel,
     HarvestRecord as HarvestRecordModel,
+    HarvestDailyRollup as RollupModel,
+)
+from schemas import (
+    DashboardStats,
+    HarvestRecord,
+    HarvestTimeseries,
+    Plantation,
+    PlantationDashboard,
 )
-from schemas import DashboardStats, PlantationDashboard
 from auth import get_current_active_user
+from cache import dashboard_cache
+from live_dashboard import dashboard_feed
+from query_budget import statement_budget
+import conditional
+import fast_json
+import live_dashboard
+from timeseries import bucket_range, date_bucket
 
 router = APIRouter()
 
+# Schema columns, for the row-based dashboard responses
+PLANTATION_COLUMNS = fast_json.columns(PlantationModel, Plantation)
+HARVEST_COLUMNS = fast_json.columns(HarvestRecordModel, HarvestRecord)
 
-@router.get("/stats", response_model=DashboardStats)
-def get_dashboard_stats(
-    db: Session = Depends(get_db), current_user=Depends(get_current_active_user)
-):
-    # Total plantations
-    total_plantations = db.query(PlantationModel).count()
 
-    # Total blocks
-    total_blocks = db.query(BlockModel).count()
+async def _load_dashboard_stats(db: AsyncSession, today: date) -> bytes:
+    """Encoded DashboardStats body."""
+    return fast_json.dumps(await live_dashboard.load_totals(db, today))
 
-    # Today's harvest
+
+@router.get("/stats", response_model=DashboardStats, responses=conditional.RESPONSES)
+@statement_budget(5)
+async def get_dashboard_stats(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_active_user),
+):
     today = date.today()
-    total_harvest_today = (
-        db.query(func.sum(HarvestRecordModel.tonnes_fresh_fruit_bunches))
-        .filter(func.date(HarvestRecordModel.date) == today)
-        .scalar()
-        or 0
+    unchanged = conditional.not_modified(
+        request,
+        response,
+        conditional.validator("stats", today, await conditional.data_version(db)),
+    )
+    if unchanged:
+        return unchanged
+    body = await dashboard_cache.get_or_load(
+        ("stats", today), lambda: _load_dashboard_stats(db, today)
     )
+    return fast_json.response(body, response)
+
 
-    # This month's harvest
-    first_day_of_month = today.replace(day=1)
-    total_harvest_this_month = (
-        db.query(func.sum(HarvestRecordModel.tonnes_fresh_fruit_bunches))
-        .filter(HarvestRecordModel.date >= first_day_of_month)
-        .scalar()
-        or 0
+@router.get(
+    "/stream",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}}},
+)
+@statement_budget(5)
+async def stream_dashboard_stats(
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_active_user),
+):
+    """Server-sent events of the DashboardStats totals: a ``snapshot``
+    event with every total, then a ``delta`` event with the increments of
+    each harvest or plantation write and a new ``snapshot`` whenever the
+    totals are reloaded. Events carry a ``seq`` that grows by one per
+    change."""
+    await dashboard_feed.ensure_loaded(db)
+    # Streams stay open for hours; don't hold a pooled connection for them
+    await db.close()
+    return StreamingResponse(
+        dashboard_feed.events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
-    return DashboardStats(
-        total_plantations=total_plantations,
-        total_blocks=total_blocks,
-        total_harvest_today=float(total_harvest_today),
-        total_harvest_this_month=float(total_harvest_this_month),
+
+# Number of latest harvests shown on each plantation dashboard
+RECENT_HARVESTS = 10
+
+
+async def _load_plantation_dashboards(
+    db: AsyncSession, plantation_id: Optional[str] = None
+):
+    """Build PlantationDashboard dicts in two queries.
+
+    The first query returns each plantation with its block count, block
+    area and this month's tonnage (from the daily rollup) through grouped
+    subqueries; the second fetches the latest harvests of every plantation
+    at once via a correlated ``IN (... LIMIT n)`` subquery, which works on
+    both SQLite and PostgreSQL.
+    """
+    first_day_of_month = date.today().replace(day=1)
+
+    block_stats = select(
+        BlockModel.plantation_id.label("plantation_id"),
+        func.count(BlockModel.id).label("total_blocks"),
+        func.sum(BlockModel.area_ha).label("total_area_ha"),
+    ).group_by(BlockModel.plantation_id)
+    month_stats = (
+        select(
+            BlockModel.plantation_id.label("plantation_id"),
+            func.sum(RollupModel.tonnes).label("harvest_this_month"),
+        )
+        .join(BlockModel, RollupModel.block_id == BlockModel.id)
+        .where(RollupModel.day >= first_day_of_month)
+        .group_by(BlockModel.plantation_id)
+    )
+    if plantation_id is not None:
+        block_stats = block_stats.where(BlockModel.plantation_id == plantation_id)
+        month_stats = month_stats.where(BlockModel.plantation_id == plantation_id)
+    block_stats = block_stats.subquery()
+    month_stats = month_stats.subquery()
+
+    summary = (
+        select(
+            *PLANTATION_COLUMNS,
+            func.coalesce(block_stats.c.total_blocks, 0).label("total_blocks"),
+            func.coalesce(block_stats.c.total_area_ha, 0).label("total_area_ha"),
+            func.coalesce(month_stats.c.harvest_this_month, 0).label(
+                "harvest_this_month"
+            ),
+        )
+        .outerjoin(block_stats, block_stats.c.plantation_id == PlantationModel.id)
+        .outerjoin(month_stats, month_stats.c.plantation_id == PlantationModel.id)
+        .order_by(PlantationModel.created_at, PlantationModel.id)
+    )
+    if plantation_id is not None:
+        summary = summary.where(PlantationModel.id == plantation_id)
+    summary = fast_json.records(await db.execute(summary))
+    if not summary:
+        return []
+
+    # Latest harvests for every plantation in one statement
+    recent_harvest = aliased(HarvestRecordModel)
+    recent_block = aliased(BlockModel)
+    recent_ids = (
+        select(recent_harvest.id)
+        .join(recent_block, recent_harvest.block_id == recent_block.id)
+        .where(recent_block.plantation_id == PlantationModel.id)
+        .order_by(recent_harvest.date.desc(), recent_harvest.id.desc())
+        .limit(RECENT_HARVESTS)
+        .correlate(PlantationModel)
+    )
+    recent = (
+        select(PlantationModel.id.label("owner_id"), *HARVEST_COLUMNS)
+        .join(HarvestRecordModel, HarvestRecordModel.id.in_(recent_ids))
+        .order_by(HarvestRecordModel.date.desc(), HarvestRecordModel.id.desc())
     )
+    if plantation_id is not None:
+        recent = recent.where(PlantationModel.id == plantation_id)
+    recent_by_plantation = defaultdict(list)
+    for harvest in fast_json.records(await db.execute(recent)):
+        recent_by_plantation[harvest.pop("owner_id")].append(harvest)
+
+    return [
+        {
+            "plantation": {name: row[name] for name in Plantation.model_fields},
+            "total_blocks": row["total_blocks"],
+            "total_area_ha": float(row["total_area_ha"]),
+            "harvest_this_month": float(row["harvest_this_month"]),
+            "recent_harvests": recent_by_plantation[row["id"]],
+        }
+        for row in summary
+    ]
 
 
-@router.get("/plantation/{plantation_id}", response_model=PlantationDashboard)
-def get_plantation_dashboard(
+@router.get(
+    "/plantations",
+    response_model=List[PlantationDashboard],
+    responses=conditional.RESPONSES,
+)
+@statement_budget(4)
+async def get_plantation_dashboards(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_active_user),
+):
+    """Dashboards for every plantation, for the estate overview."""
+    unchanged = conditional.not_modified(
+        request,
+        response,
+        conditional.validator(
+            "plantations", date.today(), await conditional.data_version(db)
+        ),
+    )
+    if unchanged:
+        return unchanged
+    return fast_json.response(await _load_plantation_dashboards(db), response)
+
+
+@router.get(
+    "/plantation/{plantation_id}",
+    response_model=PlantationDashboard,
+    responses=conditional.RESPONSES,
+)
+@statement_budget(4)
+async def get_plantation_dashboard(
     plantation_id: str,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_active_user),
 ):
-    # Get plantation
-    plantation = (
-        db.query(PlantationModel).filter(PlantationModel.id == plantation_id).first()
+    unchanged = conditional.not_modified(
+        request,
+        response,
+        conditional.validator(
+            "plantation",
+            plantation_id,
+            date.today(),
+            await conditional.data_version(db),
+        ),
     )
-    if not plantation:
+    if unchanged:
+        return unchanged
+    dashboards = await _load_plantation_dashboards(db, plantation_id)
+    if not dashboards:
         raise HTTPException(status_code=404, detail="Plantation not found")
+    return fast_json.response(dashboards[0], response)
 
-    # Get blocks count and total area
-    blocks_query = db.query(BlockModel).filter(
-        BlockModel.plantation_id == plantation_id
-    )
-    total_blocks = blocks_query.count()
-    total_area_ha = (
-        db.query(func.sum(BlockModel.area_ha))
-        .filter(BlockModel.plantation_id == plantation_id)
-        .scalar()
-        or 0
-    )
 
-    # Get this month's harvest for this plantation
-    first_day_of_month = date.today().replace(day=1)
-    harvest_this_month = (
-        db.query(func.sum(HarvestRecordModel.tonnes_fresh_fruit_bunches))
-        .join(BlockModel, HarvestRecordModel.block_id == BlockModel.id)
-        .filter(
-            BlockModel.plantation_id == plantation_id,
-            HarvestRecordModel.date >= first_day_of_month,
+# Upper bound on buckets per response, e.g. ten years of daily points
+MAX_TIMESERIES_BUCKETS = 3700
+DEFAULT_TIMESERIES_DAYS = 365
+
+
+def _timeseries_query(
+    dialect_name: str,
+    granularity: str,
+    group_by: str,
+    start: date,
+    end: date,
+    plantation_id: Optional[str],
+):
+    """Tonnage and record counts per (series key, bucket), aggregated in SQL."""
+    if group_by == "harvester":
+        # The rollup has no harvester dimension; read the raw records
+        bucket = date_bucket(dialect_name, granularity, HarvestRecordModel.date)
+        key, label = EmployeeModel.id, EmployeeModel.name
+        stmt = (
+            select(
+                key,
+                label,
+                bucket,
+                func.sum(HarvestRecordModel.tonnes_fresh_fruit_bunches),
+                func.count(HarvestRecordModel.id),
+            )
+            .join(EmployeeModel, HarvestRecordModel.harvester_id == EmployeeModel.id)
+            .where(
+                HarvestRecordModel.date >= datetime.combine(start, datetime.min.time()),
+                HarvestRecordModel.date
+                < datetime.combine(end + timedelta(days=1), datetime.min.time()),
+            )
+        )
+        if plantation_id is not None:
+            stmt = stmt.join(
+                BlockModel, HarvestRecordModel.block_id == BlockModel.id
+            ).where(BlockModel.plantation_id == plantation_id)
+    else:
+        bucket = date_bucket(dialect_name, granularity, RollupModel.day)
+        if group_by == "block":
+            key, label = BlockModel.id, BlockModel.name
+        else:
+            key, label = PlantationModel.id, PlantationModel.name
+        stmt = (
+            select(
+                key,
+                label,
+                bucket,
+                func.sum(RollupModel.tonnes),
+                func.sum(RollupModel.record_count),
+            )
+            .join(BlockModel, RollupModel.block_id == BlockModel.id)
+            .where(RollupModel.day >= start, RollupModel.day <= end)
         )
-        .scalar()
-        or 0
+        if group_by == "plantation":
+            stmt = stmt.join(
+                PlantationModel, BlockModel.plantation_id == PlantationModel.id
+            )
+        if plantation_id is not None:
+            stmt = stmt.where(BlockModel.plantation_id == plantation_id)
+    return stmt.group_by(key, label, bucket).order_by(label, key)
+
+
+async def _load_timeseries(
+    db: AsyncSession,
+    granularity: str,
+    group_by: str,
+    start: date,
+    end: date,
+    plantation_id: Optional[str],
+) -> bytes:
+    """Encoded HarvestTimeseries body."""
+    buckets = bucket_range(start, end, granularity)
+    position = {bucket: index for index, bucket in enumerate(buckets)}
+    stmt = _timeseries_query(
+        db.get_bind().dialect.name, granularity, group_by, start, end, plantation_id
     )
 
-    # Get recent harvests (last 10)
-    recent_harvests = (
-        db.query(HarvestRecordModel)
-        .join(BlockModel, HarvestRecordModel.block_id == BlockModel.id)
-        .filter(BlockModel.plantation_id == plantation_id)
-        .order_by(HarvestRecordModel.date.desc())
-        .limit(10)
-        .all()
+    series = {}
+    for key, label, bucket, tonnes, count in await db.execute(stmt):
+        if key not in series:
+            series[key] = {
+                "key": key,
+                "label": label,
+                "tonnes": [0.0] * len(buckets),
+                "record_count": [0] * len(buckets),
+            }
+        index = position[bucket]
+        series[key]["tonnes"][index] = round(float(tonnes or 0), 3)
+        series[key]["record_count"][index] = int(count)
+
+    return fast_json.dumps(
+        {
+            "granularity": granularity,
+            "group_by": group_by,
+            "start": start,
+            "end": end,
+            "buckets": buckets,
+            "series": list(series.values()),
+        }
     )
 
-    return PlantationDashboard(
-        plantation=plantation,
-        total_blocks=total_blocks,
-        total_area_ha=float(total_area_ha),
-        harvest_this_month=float(harvest_this_month),
-        recent_harvests=recent_harvests,
+
+@router.get(
+    "/timeseries", response_model=HarvestTimeseries, responses=conditional.RESPONSES
+)
+@statement_budget(3)
+async def get_harvest_timeseries(
+    request: Request,
+    response: Response,
+    granularity: str = Query("day", pattern="^(day|week|month)$"),
+    group_by: str = Query("plantation", pattern="^(block|plantation|harvester)$"),
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    plantation_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_active_user),
+):
+    """Harvest tonnage per day, week or month for each block, plantation or
+    harvester, as gap-filled columnar arrays for trend charts."""
+    end = date_to or date.today()
+    start = date_from or end - timedelta(days=DEFAULT_TIMESERIES_DAYS - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    if len(bucket_range(start, end, granularity)) > MAX_TIMESERIES_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range exceeds {MAX_TIMESERIES_BUCKETS} {granularity} buckets",
+        )
+
+    key = ("timeseries", granularity, group_by, start, end, plantation_id)
+    unchanged = conditional.not_modified(
+        request,
+        response,
+        conditional.validator(*key, await conditional.data_version(db)),
+    )
+    if unchanged:
+        return unchanged
+    body = await dashboard_cache.get_or_load(
+        key,
+        lambda: _load_timeseries(db, granularity, group_by, start, end, plantation_id),
     )
+    return fast_json.response(body, response)
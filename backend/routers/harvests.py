@@ -1,97 +1,643 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, insert, literal, select, union_all
+from typing import List, Optional
+import asyncio
+import csv
+import heapq
+import io
+import json
+import math
 import uuid
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
 
-from database import get_db
+from database import AsyncSessionLocal, get_db
 from models import (
     HarvestRecord as HarvestRecordModel,
     Block as BlockModel,
     Employee as EmployeeModel,
+    Plantation as PlantationModel,
+    HarvestTileRollup as TileRollupModel,
+)
+from schemas import (
+    BatchTrace,
+    HarvestRecord,
+    HarvestRecordCreate,
+    HarvestBulkResult,
+    HarvestBulkRowResult,
+    HarvestNearby,
+    HarvestQueueStatus,
+    HarvestTiles,
+    TraceBlock,
+    TracePlantation,
 )
-from schemas import HarvestRecord, HarvestRecordCreate
 from auth import get_current_active_user
+from pagination import paginate
+import rollup
+from cache import dashboard_cache, invalidate_harvests, trace_cache
+import batch_trace
+import conditional
+import fast_json
+from batch_trace import batch_code_filter
+from live_dashboard import dashboard_feed
+from harvest_queue import COMMITTED, QUEUED, QueueFull, harvest_queue
+import geo
+from query_budget import statement_budget
 
 router = APIRouter()
 
+# Upper bound for one bulk request; keeps the IN lists of the reference
+# check below SQLite's bound-parameter limit.
+MAX_BULK_HARVESTS = 5000
+# Rows per insert round trip; the event loop serves other requests in between
+BULK_INSERT_CHUNK_SIZE = 1000
+# Reference check, then the insert and both rollup upserts in chunks
+BULK_STATEMENT_BUDGET = 1 + 3 * math.ceil(MAX_BULK_HARVESTS / BULK_INSERT_CHUNK_SIZE)
+
+# Rows fetched from the server-side cursor per round trip during export
+EXPORT_CHUNK_SIZE = 1000
+
+# Result caps of the map endpoints
+MAX_GEO_RESULTS = 5000
+MAX_RADIUS_M = 50_000
+
+EXPORT_COLUMNS = [column.name for column in HarvestRecordModel.__table__.columns]
+# Columns of the HarvestRecord schema, for the row-based list responses
+HARVEST_COLUMNS = fast_json.columns(HarvestRecordModel, HarvestRecord)
+
+
+def generate_batch_code(harvest_date: datetime) -> str:
+    date_str = harvest_date.strftime("%Y%m%d")
+    return f"LOT-{date_str}-{str(uuid.uuid4())[:8].upper()}"
+
+
+async def _known_references(db: AsyncSession, harvests: List[HarvestRecordCreate]):
+    """(block ids, harvester ids) of ``harvests`` that exist, in one round
+    trip."""
+    block_ids = {harvest.block_id for harvest in harvests}
+    harvester_ids = {harvest.harvester_id for harvest in harvests}
+    known = union_all(
+        select(literal("block"), BlockModel.id).where(BlockModel.id.in_(block_ids)),
+        select(literal("harvester"), EmployeeModel.id).where(
+            EmployeeModel.id.in_(harvester_ids)
+        ),
+    )
+    known_blocks = set()
+    known_harvesters = set()
+    for kind, ref_id in await db.execute(known):
+        (known_blocks if kind == "block" else known_harvesters).add(ref_id)
+    return known_blocks, known_harvesters
+
 
 @router.post("/", response_model=HarvestRecord)
-def create_harvest(
+@statement_budget(6)
+async def create_harvest(
     harvest: HarvestRecordCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_active_user),
 ):
     # Validate block exists
-    block = db.query(BlockModel).filter(BlockModel.id == harvest.block_id).first()
+    block = await db.get(BlockModel, harvest.block_id)
     if not block:
         raise HTTPException(status_code=404, detail="Block not found")
 
     # Validate harvester exists
-    harvester = (
-        db.query(EmployeeModel).filter(EmployeeModel.id == harvest.harvester_id).first()
-    )
+    harvester = await db.get(EmployeeModel, harvest.harvester_id)
     if not harvester:
         raise HTTPException(status_code=404, detail="Harvester not found")
 
     # Generate batch code
-    date_str = harvest.date.strftime("%Y%m%d")
-    batch_code = f"LOT-{date_str}-{str(uuid.uuid4())[:8].upper()}"
+    batch_code = generate_batch_code(harvest.date)
 
     db_harvest = HarvestRecordModel(**harvest.dict(), batch_code=batch_code)
     db.add(db_harvest)
-    db.commit()
-    db.refresh(db_harvest)
+    await db.run_sync(rollup.apply_harvests, [db_harvest])
+    await db.commit()
+    await db.refresh(db_harvest)
+    invalidate_harvests()
+    batch_code_filter.add([batch_code])
+    dashboard_feed.record_harvests(
+        [(db_harvest.date, db_harvest.tonnes_fresh_fruit_bunches)]
+    )
     return db_harvest
 
 
+def _bulk_rows(harvests, known_blocks, known_harvesters):
+    """(row results, insert rows, rollup deltas) of a bulk request."""
+    results = []
+    rows = []
+    batch_codes = set()
+    now = datetime.utcnow()
+    for index, harvest in enumerate(harvests):
+        if harvest.block_id not in known_blocks:
+            results.append(HarvestBulkRowResult(index=index, error="Block not found"))
+            continue
+        if harvest.harvester_id not in known_harvesters:
+            results.append(
+                HarvestBulkRowResult(index=index, error="Harvester not found")
+            )
+            continue
+
+        batch_code = generate_batch_code(harvest.date)
+        while batch_code in batch_codes:
+            batch_code = generate_batch_code(harvest.date)
+        batch_codes.add(batch_code)
+
+        row = harvest.dict()
+        row.update(
+            id=str(uuid.uuid4()),
+            batch_code=batch_code,
+            # Set here rather than by the column default, off the loop
+            geohash=geo.encode(row["geo_lat"], row["geo_lng"]),
+            created_at=now,
+            updated_at=now,
+        )
+        rows.append(row)
+        results.append(
+            HarvestBulkRowResult(index=index, id=row["id"], batch_code=batch_code)
+        )
+    return results, rows, rollup.harvest_deltas(rows)
+
+
+@router.post("/bulk", response_model=HarvestBulkResult)
+@statement_budget(BULK_STATEMENT_BUDGET)
+async def create_harvests_bulk(
+    harvests: List[HarvestRecordCreate],
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_active_user),
+):
+    """Insert many harvest records in one transaction.
+
+    Rows referencing an unknown block or harvester are reported in
+    ``results`` and skipped; the remaining rows are still inserted.
+    """
+    if len(harvests) > MAX_BULK_HARVESTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_BULK_HARVESTS} harvest records per request",
+        )
+
+    known_blocks, known_harvesters = await _known_references(db, harvests)
+    # Building thousands of rows and their rollup deltas is CPU work that
+    # would stall every other request on the event loop
+    results, rows, deltas = await asyncio.to_thread(
+        _bulk_rows, harvests, known_blocks, known_harvesters
+    )
+
+    if rows:
+        # executemany; SQLAlchemy batches this into multi-row INSERTs
+        for start in range(0, len(rows), BULK_INSERT_CHUNK_SIZE):
+            await db.execute(
+                insert(HarvestRecordModel),
+                rows[start : start + BULK_INSERT_CHUNK_SIZE],
+            )
+        await db.run_sync(rollup.apply_deltas, deltas)
+        await db.commit()
+        invalidate_harvests()
+        batch_code_filter.add([row["batch_code"] for row in rows])
+        dashboard_feed.record_harvests(
+            (row["date"], row["tonnes_fresh_fruit_bunches"]) for row in rows
+        )
+
+    return HarvestBulkResult(
+        created=len(rows), failed=len(harvests) - len(rows), results=results
+    )
+
+
+@router.post("/queue", response_model=HarvestQueueStatus, status_code=202)
+@statement_budget(2)
+async def queue_harvest(
+    harvest: HarvestRecordCreate,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_active_user),
+):
+    """Accept a harvest record for a later group commit (see
+    harvest_queue.py). The record is validated and spooled, and its
+    ``id`` and ``batch_code`` are final; poll ``Location`` for the
+    outcome."""
+    if not harvest_queue.accepting:
+        raise HTTPException(
+            status_code=503, detail="Asynchronous harvest ingestion is disabled"
+        )
+    known_blocks, known_harvesters = await _known_references(db, [harvest])
+    if harvest.block_id not in known_blocks:
+        raise HTTPException(status_code=404, detail="Block not found")
+    if harvest.harvester_id not in known_harvesters:
+        raise HTTPException(status_code=404, detail="Harvester not found")
+
+    now = datetime.utcnow()
+    row = harvest.dict()
+    row.update(
+        id=str(uuid.uuid4()),
+        batch_code=generate_batch_code(harvest.date),
+        created_at=now,
+        updated_at=now,
+    )
+    try:
+        await harvest_queue.submit(row)
+    except QueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Harvest queue is full, try again later",
+            headers={"Retry-After": "1"},
+        )
+    response.headers["Location"] = str(
+        request.url_for("read_queued_harvest", harvest_id=row["id"])
+    )
+    return HarvestQueueStatus(id=row["id"], batch_code=row["batch_code"], status=QUEUED)
+
+
+@router.get("/queue/{harvest_id}", response_model=HarvestQueueStatus)
+@statement_budget(2)
+async def read_queued_harvest(
+    harvest_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_active_user),
+):
+    """Outcome of a record accepted by ``POST /queue``. Records accepted
+    by another worker are only found once committed."""
+    known = harvest_queue.status(harvest_id)
+    if known is not None:
+        status, batch_code, error = known
+        return HarvestQueueStatus(
+            id=harvest_id, batch_code=batch_code, status=status, error=error
+        )
+    batch_code = await db.scalar(
+        select(HarvestRecordModel.batch_code).where(HarvestRecordModel.id == harvest_id)
+    )
+    if batch_code is None:
+        raise HTTPException(status_code=404, detail="Harvest not found")
+    return HarvestQueueStatus(id=harvest_id, batch_code=batch_code, status=COMMITTED)
+
+
 @router.get("/", response_model=List[HarvestRecord])
-def read_harvests(
+@statement_budget(2)
+async def read_harvests(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_active_user),
+):
+    # Newest first; pass X-Next-Cursor back as ?cursor= for the next page
+    harvests = await paginate(
+        db,
+        select(*HARVEST_COLUMNS),
+        response,
+        (HarvestRecordModel.date, HarvestRecordModel.id),
+        cursor=cursor,
+        skip=skip,
+        limit=limit,
+        descending=True,
+        as_rows=True,
+    )
+    return fast_json.response(fast_json.records(harvests), response)
+
+
+def _date_range(stmt, date_from: Optional[date], date_to: Optional[date]):
+    """Harvests from ``date_from`` through ``date_to``, both whole days."""
+    if date_from is not None:
+        stmt = stmt.where(
+            HarvestRecordModel.date >= datetime.combine(date_from, time())
+        )
+    if date_to is not None:
+        end = datetime.combine(date_to + timedelta(days=1), time())
+        stmt = stmt.where(HarvestRecordModel.date < end)
+    return stmt
+
+
+async def _export_rows(stmt, fmt: str):
+    """Yield the export body chunk by chunk from a server-side cursor.
+
+    The generator owns its session so the connection stays open for as
+    long as the client keeps reading, and only one chunk of rows is held
+    in memory at a time.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_COLUMNS)
+            yield buffer.getvalue()
+        async for rows in result.partitions():
+            if fmt == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerows(
+                    [
+                        value.isoformat() if isinstance(value, datetime) else value
+                        for value in row
+                    ]
+                    for row in rows
+                )
+                yield buffer.getvalue()
+            else:
+                yield "".join(
+                    json.dumps(dict(row._mapping), default=datetime.isoformat) + "\n"
+                    for row in rows
+                )
+
+
+@router.get("/export")
+@statement_budget(2)
+async def export_harvests(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    plantation_id: Optional[str] = None,
     current_user=Depends(get_current_active_user),
 ):
-    harvests = db.query(HarvestRecordModel).offset(skip).limit(limit).all()
-    return harvests
+    """Stream harvest records as CSV or NDJSON for audits and reconciliation."""
+    stmt = select(*HarvestRecordModel.__table__.columns).order_by(
+        HarvestRecordModel.date, HarvestRecordModel.id
+    )
+    stmt = _date_range(stmt, date_from, date_to)
+    if plantation_id is not None:
+        stmt = stmt.join(BlockModel, HarvestRecordModel.block_id == BlockModel.id)
+        stmt = stmt.where(BlockModel.plantation_id == plantation_id)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"harvests.{format}"
+    return StreamingResponse(
+        _export_rows(stmt, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
-@router.get("/{harvest_id}", response_model=HarvestRecord)
-def read_harvest(
-    harvest_id: str,
-    db: Session = Depends(get_db),
+@router.get("/geo/bbox", response_model=List[HarvestRecord])
+@statement_budget(2)
+async def read_harvests_in_bbox(
+    bbox: geo.BBox = Depends(geo.bbox_query),
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    limit: int = Query(500, ge=1, le=MAX_GEO_RESULTS),
+    db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_active_user),
 ):
-    harvest = (
-        db.query(HarvestRecordModel).filter(HarvestRecordModel.id == harvest_id).first()
+    """Harvest records inside a bounding box, newest first."""
+    postgis = await geo.use_postgis(db)
+    stmt = select(*HARVEST_COLUMNS).where(
+        geo.within_bbox(
+            postgis,
+            HarvestRecordModel.geohash,
+            HarvestRecordModel.geo_lat,
+            HarvestRecordModel.geo_lng,
+            bbox,
+        )
     )
+    stmt = _date_range(stmt, date_from, date_to)
+    stmt = stmt.order_by(
+        HarvestRecordModel.date.desc(), HarvestRecordModel.id.desc()
+    ).limit(limit)
+    result = await db.execute(stmt)
+    return fast_json.response(fast_json.records(result))
+
+
+@router.get("/geo/nearby", response_model=List[HarvestNearby])
+@statement_budget(3)
+async def read_harvests_nearby(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(1000, gt=0, le=MAX_RADIUS_M),
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    limit: int = Query(100, ge=1, le=MAX_GEO_RESULTS),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_active_user),
+):
+    """Harvest records within ``radius_m`` meters of a point, nearest first."""
+    if await geo.use_postgis(db):
+        within, distance = geo.postgis_within(
+            HarvestRecordModel.geo_lat, HarvestRecordModel.geo_lng, lat, lng, radius_m
+        )
+        stmt = _date_range(
+            select(*HARVEST_COLUMNS, distance.label("distance_m")).where(within),
+            date_from,
+            date_to,
+        )
+        result = await db.execute(stmt.order_by(distance).limit(limit))
+        nearest = fast_json.records(result)
+    else:
+        # Distances of the candidates in the circle's bounding box, then
+        # full rows for the nearest ones only
+        candidates = select(
+            HarvestRecordModel.id,
+            HarvestRecordModel.geo_lat,
+            HarvestRecordModel.geo_lng,
+        ).where(
+            geo.bbox_filter(
+                HarvestRecordModel.geohash,
+                HarvestRecordModel.geo_lat,
+                HarvestRecordModel.geo_lng,
+                geo.radius_bbox(lat, lng, radius_m),
+            )
+        )
+        candidates = _date_range(candidates, date_from, date_to)
+        distances = {}
+        for harvest_id, harvest_lat, harvest_lng in await db.execute(candidates):
+            distance = geo.distance_m(lat, lng, harvest_lat, harvest_lng)
+            if distance <= radius_m:
+                distances[harvest_id] = distance
+        nearest_ids = heapq.nsmallest(limit, distances, key=distances.get)
+        if not nearest_ids:
+            return fast_json.response([])
+        result = await db.execute(
+            select(*HARVEST_COLUMNS).where(HarvestRecordModel.id.in_(nearest_ids))
+        )
+        harvests = {harvest["id"]: harvest for harvest in fast_json.records(result)}
+        nearest = []
+        for harvest_id in nearest_ids:
+            harvest = harvests[harvest_id]
+            harvest["distance_m"] = distances[harvest_id]
+            nearest.append(harvest)
+
+    for harvest in nearest:
+        harvest["distance_m"] = round(harvest["distance_m"], 1)
+    return fast_json.response(nearest)
+
+
+def _tiles_query(precision: int, bbox, date_from, date_to):
+    """(cell, count, tonnes, lat sum, lng sum) per tile, from the tile
+    rollup when it is fine enough, else from the covering geohash index."""
+    if precision <= geo.TILE_ROLLUP_PRECISION:
+        cell = func.substr(TileRollupModel.cell, 1, precision)
+        stmt = select(
+            cell,
+            func.sum(TileRollupModel.record_count),
+            func.sum(TileRollupModel.tonnes),
+            func.sum(TileRollupModel.lat_sum),
+            func.sum(TileRollupModel.lng_sum),
+        ).where(geo.cover_filter(TileRollupModel.cell, bbox, geo.TILE_ROLLUP_PRECISION))
+        if date_from is not None:
+            stmt = stmt.where(TileRollupModel.day >= date_from)
+        if date_to is not None:
+            stmt = stmt.where(TileRollupModel.day <= date_to)
+    else:
+        cell = func.substr(HarvestRecordModel.geohash, 1, precision)
+        stmt = select(
+            cell,
+            func.count(),
+            func.sum(HarvestRecordModel.tonnes_fresh_fruit_bunches),
+            func.sum(HarvestRecordModel.geo_lat),
+            func.sum(HarvestRecordModel.geo_lng),
+        ).where(geo.cover_filter(HarvestRecordModel.geohash, bbox))
+        stmt = _date_range(stmt, date_from, date_to)
+    return stmt.group_by(cell)
+
+
+async def _load_tiles(db, bbox, precision, date_from, date_to) -> bytes:
+    """Encoded HarvestTiles body."""
+    # Tiles are whole cells, so edge tiles also count harvests just outside
+    # the box
+    wanted = geo.cells(bbox, precision)
+    tiles = [
+        {
+            "geohash": geohash,
+            "lat": round(lat_sum / count, 6),
+            "lng": round(lng_sum / count, 6),
+            "record_count": int(count),
+            "tonnes": round(float(tonnes or 0), 3),
+        }
+        for geohash, count, tonnes, lat_sum, lng_sum in await db.execute(
+            _tiles_query(precision, bbox, date_from, date_to)
+        )
+        if geohash in wanted and count
+    ]
+    return fast_json.dumps(
+        {
+            "precision": precision,
+            "tiles": sorted(tiles, key=lambda tile: tile["geohash"]),
+        }
+    )
+
+
+@router.get("/geo/tiles", response_model=HarvestTiles)
+@statement_budget(1)
+async def read_harvest_tiles(
+    bbox: geo.BBox = Depends(geo.bbox_query),
+    precision: Optional[int] = Query(None, ge=1, le=geo.GEOHASH_PRECISION - 1),
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_active_user),
+):
+    """Harvest counts and tonnage per geohash cell for map views.
+
+    Tiles are the geohash cells of ``precision`` characters intersecting the
+    box, placed at the mean location of their harvests; without
+    ``precision`` the finest grid with at most 256 tiles is used. ``from``
+    and ``to`` are inclusive days.
+    """
+    if precision is None:
+        precision = geo.tile_precision(bbox)
+    elif geo.cell_count(bbox, precision) > geo.MAX_TILE_CELLS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {geo.MAX_TILE_CELLS} tiles per request; "
+            "lower the precision or shrink the box",
+        )
+    body = await dashboard_cache.get_or_load(
+        ("tiles", bbox, precision, date_from, date_to),
+        lambda: _load_tiles(db, bbox, precision, date_from, date_to),
+    )
+    return fast_json.response(body)
+
+
+@router.get(
+    "/{harvest_id}", response_model=HarvestRecord, responses=conditional.RESPONSES
+)
+@statement_budget(2)
+async def read_harvest(
+    harvest_id: str,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_active_user),
+):
+    harvest = await db.get(HarvestRecordModel, harvest_id)
     if harvest is None:
         raise HTTPException(status_code=404, detail="Harvest record not found")
-    return harvest
+    unchanged = conditional.not_modified(
+        request,
+        response,
+        conditional.validator(
+            "harvest", harvest.id, harvest.updated_at, last_modified=harvest.updated_at
+        ),
+    )
+    return unchanged or harvest
 
 
-@router.get("/trace/{batch_code}", response_model=HarvestRecord)
-def trace_batch(batch_code: str, db: Session = Depends(get_db)):
-    """Public endpoint for tracing batch codes"""
-    harvest = (
-        db.query(HarvestRecordModel)
-        .filter(HarvestRecordModel.batch_code == batch_code)
-        .first()
+async def _load_trace(db: AsyncSession, batch_code: str) -> Optional[tuple]:
+    """(JSON body, ETag) of a batch with its block and plantation, or None."""
+    result = await db.execute(
+        select(HarvestRecordModel, BlockModel, PlantationModel)
+        .outerjoin(BlockModel, HarvestRecordModel.block_id == BlockModel.id)
+        .outerjoin(PlantationModel, BlockModel.plantation_id == PlantationModel.id)
+        .where(HarvestRecordModel.batch_code == batch_code)
     )
-    if harvest is None:
-        raise HTTPException(status_code=404, detail="Batch not found")
-    return harvest
+    row = result.first()
+    if row is None:
+        return None
+    harvest, block, plantation = row
+    trace = BatchTrace(
+        **HarvestRecord.model_validate(harvest).model_dump(),
+        block=TraceBlock.model_validate(block) if block else None,
+        plantation=TracePlantation.model_validate(plantation) if plantation else None,
+    )
+    body = trace.model_dump_json().encode()
+    return body, conditional.etag_for(body)
+
+
+@router.get(
+    "/trace/{batch_code}",
+    response_model=BatchTrace,
+    responses={304: {"description": "Not modified (If-None-Match)"}},
+)
+@statement_budget(1)
+async def trace_batch(
+    batch_code: str, request: Request, db: AsyncSession = Depends(get_db)
+):
+    """Public endpoint for tracing batch codes, with the block and
+    plantation the batch was harvested from"""
+    trace = trace_cache.get(batch_code)
+    if trace is None:
+        # Codes that were never issued are refused without a query
+        if batch_code_filter.might_exist(batch_code):
+            trace = await _load_trace(db, batch_code)
+        if trace is None:
+            # Not cached: the code may be committed by another worker or
+            # the harvest queue a moment later
+            raise HTTPException(
+                status_code=404,
+                detail="Batch not found",
+                headers={"Cache-Control": "no-store"},
+            )
+        trace_cache.set(batch_code, trace)
+
+    body, etag = trace
+    headers = {
+        "Cache-Control": f"public, max-age={batch_trace.TRACE_MAX_AGE_SECONDS}",
+        "ETag": etag,
+    }
+    if conditional.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 
 @router.get("/block/{block_id}", response_model=List[HarvestRecord])
-def read_harvests_by_block(
+@statement_budget(2)
+async def read_harvests_by_block(
     block_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_active_user),
 ):
-    harvests = (
-        db.query(HarvestRecordModel)
-        .filter(HarvestRecordModel.block_id == block_id)
-        .all()
+    result = await db.execute(
+        select(*HARVEST_COLUMNS).where(HarvestRecordModel.block_id == block_id)
     )
-    return harvests
+    return fast_json.response(fast_json.records(result))
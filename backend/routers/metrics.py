@@ -0,0 +1,109 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from auth import get_current_admin_user
+from batch_trace import batch_code_filter
+from cache import cache_stats
+from database import async_engine
+from instrumentation import render_metrics
+from harvest_queue import harvest_queue
+from live_dashboard import dashboard_feed
+from pool_metrics import pool_metrics
+from loop_monitor import loop_monitor
+import startup
+
+router = APIRouter()
+
+
+def _runtime_metrics() -> list:
+    """Pool, event-loop, cache, trace filter, live dashboard, harvest queue
+    and startup figures as Prometheus samples."""
+    pool = pool_metrics.stats(async_engine.sync_engine.pool)
+    loop = loop_monitor.stats()
+    trace_filter = batch_code_filter.stats()
+    lines = [
+        "# TYPE db_pool_checked_out gauge",
+        f"db_pool_checked_out {pool.get('checked_out', 0)}",
+        "# TYPE db_pool_idle gauge",
+        f"db_pool_idle {pool.get('idle', 0)}",
+        "# TYPE db_pool_overflow gauge",
+        f"db_pool_overflow {pool.get('overflow', 0)}",
+        "# TYPE db_pool_checkout_timeouts_total counter",
+        f"db_pool_checkout_timeouts_total {pool['checkout_timeouts']}",
+        "# TYPE db_pool_wait_seconds_total counter",
+        f"db_pool_wait_seconds_total {pool['wait_seconds_total']}",
+        "# TYPE event_loop_lag_seconds gauge",
+        f"event_loop_lag_seconds {loop['last_lag_ms'] / 1000}",
+        "# TYPE event_loop_lag_seconds_max gauge",
+        f"event_loop_lag_seconds_max {loop['max_lag_ms'] / 1000}",
+        "# TYPE cache_hits_total counter",
+    ]
+    caches = cache_stats()
+    lines += [
+        f'cache_hits_total{{cache="{name}"}} {c["hits"]}' for name, c in caches.items()
+    ]
+    lines.append("# TYPE cache_misses_total counter")
+    lines += [
+        f'cache_misses_total{{cache="{name}"}} {c["misses"]}'
+        for name, c in caches.items()
+    ]
+    lines += [
+        "# TYPE trace_filter_rejected_total counter",
+        f"trace_filter_rejected_total {trace_filter['rejected']}",
+        "# TYPE trace_filter_passed_total counter",
+        f"trace_filter_passed_total {trace_filter['passed']}",
+        "# TYPE trace_filter_codes gauge",
+        f"trace_filter_codes {trace_filter['codes']}",
+    ]
+    queue = harvest_queue.stats()
+    lines += [
+        "# TYPE dashboard_stream_subscribers gauge",
+        f"dashboard_stream_subscribers {dashboard_feed.subscribers}",
+        "# TYPE harvest_queue_pending gauge",
+        f"harvest_queue_pending {queue['pending']}",
+        "# TYPE harvest_queue_committed_total counter",
+        f"harvest_queue_committed_total {queue['committed']}",
+        "# TYPE harvest_queue_failed_total counter",
+        f"harvest_queue_failed_total {queue['failed']}",
+        "# TYPE harvest_queue_flushes_total counter",
+        f"harvest_queue_flushes_total {queue['flushes']}",
+    ]
+    if startup.startup_seconds is not None:
+        lines += [
+            "# TYPE app_startup_seconds gauge",
+            f"app_startup_seconds {startup.startup_seconds}",
+        ]
+    return lines
+
+
+@router.get("", response_class=PlainTextResponse)
+def read_prometheus_metrics():
+    """Prometheus text exposition of request, SQL and runtime metrics."""
+    return PlainTextResponse(
+        render_metrics(_runtime_metrics()),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+@router.get("/cache")
+def read_cache_metrics(current_user=Depends(get_current_admin_user)):
+    """Hit/miss counters and sizes of the in-process caches."""
+    return cache_stats()
+
+
+@router.get("/trace-filter")
+def read_trace_filter_metrics(current_user=Depends(get_current_admin_user)):
+    """Size and hit counters of the batch-code Bloom filter."""
+    return batch_code_filter.stats()
+
+
+@router.get("/event-loop")
+def read_event_loop_metrics(current_user=Depends(get_current_admin_user)):
+    """Scheduling delay of the event loop, as seen by the lag monitor."""
+    return loop_monitor.stats()
+
+
+@router.get("/db-pool")
+def read_db_pool_metrics(current_user=Depends(get_current_admin_user)):
+    """Saturation of the API connection pool."""
+    return pool_metrics.stats(async_engine.sync_engine.pool)
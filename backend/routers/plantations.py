@@ -1,88 +1,252 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 import uuid
 
 from database import get_db
 from models import Plantation as PlantationModel
-from schemas import Plantation, PlantationCreate, PlantationUpdate
+from schemas import Plantation, PlantationCreate, PlantationNearby, PlantationUpdate
 from auth import get_current_active_user
+from cache import invalidate_plantations, plantation_cache
+from live_dashboard import dashboard_feed
+from pagination import NEXT_CURSOR_HEADER, paginate
+from query_budget import statement_budget
+import conditional
+import fast_json
+import geo
 
 router = APIRouter()
 
+# Result caps of the map endpoints
+MAX_GEO_RESULTS = 1000
+MAX_RADIUS_M = 500_000
+
+# Columns of the Plantation schema, for the row-based list responses
+PLANTATION_COLUMNS = fast_json.columns(PlantationModel, Plantation)
+
 
 @router.post("/", response_model=Plantation)
-def create_plantation(
+async def create_plantation(
     plantation: PlantationCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_active_user),
 ):
     db_plantation = PlantationModel(**plantation.dict())
     db.add(db_plantation)
-    db.commit()
-    db.refresh(db_plantation)
+    await db.commit()
+    await db.refresh(db_plantation)
+    invalidate_plantations()
+    dashboard_feed.record_plantations(1)
     return db_plantation
 
 
-@router.get("/", response_model=List[Plantation])
-def read_plantations(
+async def _table_version(db: AsyncSession) -> tuple:
+    """(row count, max(updated_at)) of the plantations table."""
+    result = await db.execute(
+        select(func.count(), func.max(PlantationModel.updated_at))
+    )
+    return tuple(result.one())
+
+
+@router.get("/", response_model=List[Plantation], responses=conditional.RESPONSES)
+@statement_budget(3)
+async def read_plantations(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_active_user),
 ):
-    plantations = db.query(PlantationModel).offset(skip).limit(limit).all()
-    return plantations
+    version = await plantation_cache.get_or_load(
+        ("version",), lambda: _table_version(db)
+    )
+    unchanged = conditional.not_modified(
+        request,
+        response,
+        conditional.validator("plantations", skip, limit, cursor, version),
+    )
+    if unchanged:
+        return unchanged
 
+    async def load_page():
+        page = Response()
+        rows = await paginate(
+            db,
+            select(*PLANTATION_COLUMNS),
+            page,
+            (PlantationModel.created_at, PlantationModel.id),
+            cursor=cursor,
+            skip=skip,
+            limit=limit,
+            as_rows=True,
+        )
+        body = fast_json.dumps(fast_json.records(rows))
+        return body, page.headers.get(NEXT_CURSOR_HEADER)
 
-@router.get("/{plantation_id}", response_model=Plantation)
-def read_plantation(
-    plantation_id: str,
-    db: Session = Depends(get_db),
+    body, next_cursor = await plantation_cache.get_or_load(
+        ("page", skip, limit, cursor), load_page
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return fast_json.response(body, response)
+
+
+@router.get("/geo/bbox", response_model=List[Plantation])
+@statement_budget(2)
+async def read_plantations_in_bbox(
+    bbox: geo.BBox = Depends(geo.bbox_query),
+    limit: int = Query(500, ge=1, le=MAX_GEO_RESULTS),
+    db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_active_user),
 ):
-    plantation = (
-        db.query(PlantationModel).filter(PlantationModel.id == plantation_id).first()
+    """Plantations located inside a bounding box."""
+
+    async def load():
+        postgis = await geo.use_postgis(db)
+        result = await db.execute(
+            select(*PLANTATION_COLUMNS)
+            .where(
+                geo.within_bbox(
+                    postgis,
+                    PlantationModel.geohash,
+                    PlantationModel.location_lat,
+                    PlantationModel.location_lng,
+                    bbox,
+                )
+            )
+            .order_by(PlantationModel.name, PlantationModel.id)
+            .limit(limit)
+        )
+        return fast_json.dumps(fast_json.records(result))
+
+    return fast_json.response(
+        await plantation_cache.get_or_load(("bbox", bbox, limit), load)
     )
+
+
+@router.get("/geo/nearby", response_model=List[PlantationNearby])
+@statement_budget(2)
+async def read_plantations_nearby(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(50_000, gt=0, le=MAX_RADIUS_M),
+    limit: int = Query(20, ge=1, le=MAX_GEO_RESULTS),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_active_user),
+):
+    """Plantations within ``radius_m`` meters of a point, nearest first."""
+    if await geo.use_postgis(db):
+        within, distance = geo.postgis_within(
+            PlantationModel.location_lat,
+            PlantationModel.location_lng,
+            lat,
+            lng,
+            radius_m,
+        )
+        result = await db.execute(
+            select(*PLANTATION_COLUMNS, distance.label("distance_m"))
+            .where(within)
+            .order_by(distance)
+            .limit(limit)
+        )
+        nearest = fast_json.records(result)
+    else:
+        result = await db.execute(
+            select(*PLANTATION_COLUMNS).where(
+                geo.bbox_filter(
+                    PlantationModel.geohash,
+                    PlantationModel.location_lat,
+                    PlantationModel.location_lng,
+                    geo.radius_bbox(lat, lng, radius_m),
+                )
+            )
+        )
+        nearest = []
+        for plantation in fast_json.records(result):
+            plantation["distance_m"] = geo.distance_m(
+                lat, lng, plantation["location_lat"], plantation["location_lng"]
+            )
+            if plantation["distance_m"] <= radius_m:
+                nearest.append(plantation)
+        nearest.sort(key=lambda plantation: plantation["distance_m"])
+        nearest = nearest[:limit]
+
+    for plantation in nearest:
+        plantation["distance_m"] = round(plantation["distance_m"], 1)
+    return fast_json.response(nearest)
+
+
+@router.get(
+    "/{plantation_id}", response_model=Plantation, responses=conditional.RESPONSES
+)
+@statement_budget(2)
+async def read_plantation(
+    plantation_id: str,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_active_user),
+):
+    plantation = plantation_cache.get(("id", plantation_id))
     if plantation is None:
-        raise HTTPException(status_code=404, detail="Plantation not found")
-    return plantation
+        plantation = await db.get(PlantationModel, plantation_id)
+        if plantation is None:
+            raise HTTPException(status_code=404, detail="Plantation not found")
+        plantation = Plantation.model_validate(plantation)
+        plantation_cache.set(("id", plantation_id), plantation)
+
+    unchanged = conditional.not_modified(
+        request,
+        response,
+        conditional.validator(
+            "plantation",
+            plantation.id,
+            plantation.updated_at,
+            last_modified=plantation.updated_at,
+        ),
+    )
+    return unchanged or plantation
 
 
 @router.put("/{plantation_id}", response_model=Plantation)
-def update_plantation(
+async def update_plantation(
     plantation_id: str,
     plantation: PlantationUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_active_user),
 ):
-    db_plantation = (
-        db.query(PlantationModel).filter(PlantationModel.id == plantation_id).first()
-    )
+    db_plantation = await db.get(PlantationModel, plantation_id)
     if db_plantation is None:
         raise HTTPException(status_code=404, detail="Plantation not found")
 
     update_data = plantation.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(db_plantation, field, value)
+    db_plantation.geohash = geo.encode(
+        db_plantation.location_lat, db_plantation.location_lng
+    )
 
-    db.commit()
-    db.refresh(db_plantation)
+    await db.commit()
+    await db.refresh(db_plantation)
+    invalidate_plantations()
     return db_plantation
 
 
 @router.delete("/{plantation_id}")
-def delete_plantation(
+async def delete_plantation(
     plantation_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_active_user),
 ):
-    db_plantation = (
-        db.query(PlantationModel).filter(PlantationModel.id == plantation_id).first()
-    )
+    db_plantation = await db.get(PlantationModel, plantation_id)
     if db_plantation is None:
         raise HTTPException(status_code=404, detail="Plantation not found")
 
-    db.delete(db_plantation)
-    db.commit()
+    await db.delete(db_plantation)
+    await db.commit()
+    invalidate_plantations()
+    dashboard_feed.record_plantations(-1)
     return {"message": "Plantation deleted successfully"}
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+
+from database import get_db
+from schemas import SyncChanges
+from auth import get_current_active_user
+from query_budget import statement_budget
+import fast_json
+import sync
+
+router = APIRouter()
+
+
+@router.get("", response_model=SyncChanges)
+@statement_budget(6)
+async def read_changes(
+    since: Optional[str] = None,
+    limit: int = Query(sync.SYNC_PAGE_SIZE, ge=1, le=sync.MAX_SYNC_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_active_user),
+):
+    """Plantations, blocks, employees and harvest records created, updated
+    or deleted since the ``since`` token of the previous sync; without a
+    token, everything. At most ``limit`` rows of each kind per call."""
+    return fast_json.response(await sync.changes(db, since, limit))
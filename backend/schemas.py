@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 
 
 # Plantation schemas
@@ -107,6 +107,55 @@ class HarvestRecord(HarvestRecordBase):
         from_attributes = True
 
 
+class HarvestBulkRowResult(BaseModel):
+    index: int
+    id: Optional[str] = None
+    batch_code: Optional[str] = None
+    error: Optional[str] = None
+
+
+class HarvestBulkResult(BaseModel):
+    created: int
+    failed: int
+    results: List[HarvestBulkRowResult]
+
+
+class HarvestQueueStatus(BaseModel):
+    """A harvest record accepted by the write-behind queue: ``queued``,
+    ``committed`` or ``failed`` (with ``error``)."""
+
+    id: str
+    batch_code: str
+    status: str
+    error: Optional[str] = None
+
+
+class TraceBlock(BaseModel):
+    id: str
+    name: str
+    area_ha: Optional[float] = None
+    planting_year: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+
+class TracePlantation(BaseModel):
+    id: str
+    name: str
+    address: Optional[str] = None
+    location_lat: Optional[float] = None
+    location_lng: Optional[float] = None
+
+    class Config:
+        from_attributes = True
+
+
+class BatchTrace(HarvestRecord):
+    block: Optional[TraceBlock] = None
+    plantation: Optional[TracePlantation] = None
+
+
 # User schemas
 class UserBase(BaseModel):
     username: str
@@ -158,3 +207,102 @@ class PlantationDashboard(BaseModel):
     total_area_ha: float
     harvest_this_month: float
     recent_harvests: List[HarvestRecord]
+
+
+class TimeseriesSeries(BaseModel):
+    key: str
+    label: Optional[str] = None
+    tonnes: List[float]
+    record_count: List[int]
+
+
+class HarvestTimeseries(BaseModel):
+    """Columnar series: ``tonnes[i]`` belongs to the bucket ``buckets[i]``."""
+
+    granularity: str
+    group_by: str
+    start: date
+    end: date
+    buckets: List[date]
+    series: List[TimeseriesSeries]
+
+
+# Analytics schemas
+class BlockYield(BaseModel):
+    rank: int
+    block_id: str
+    block_name: str
+    plantation_id: Optional[str] = None
+    area_ha: Optional[float] = None
+    planting_year: Optional[int] = None
+    palm_age: Optional[int] = None
+    tonnes_12m: float
+    yield_t_ha_12m: Optional[float] = None
+    cohort_yield_t_ha: Optional[float] = None
+    vs_cohort: Optional[float] = None
+
+
+class YieldCohorts(BaseModel):
+    palm_age: List[int]
+    yield_t_ha_yr: List[Optional[float]]
+    block_months: List[int]
+
+
+class YieldAnalytics(BaseModel):
+    start: date
+    end: date
+    block_count: int
+    area_ha: float
+    tonnes_12m: float
+    yield_t_ha_12m: Optional[float] = None
+    months: List[date]
+    rolling_12m_t_ha: List[Optional[float]]
+    cohorts: YieldCohorts
+    top_blocks: List[BlockYield]
+    bottom_blocks: List[BlockYield]
+
+
+# Geo schemas
+class PlantationNearby(Plantation):
+    distance_m: float
+
+
+class HarvestNearby(HarvestRecord):
+    distance_m: float
+
+
+class GeoTile(BaseModel):
+    geohash: str
+    lat: float
+    lng: float
+    record_count: int
+    tonnes: float
+
+
+class HarvestTiles(BaseModel):
+    precision: int
+    tiles: List[GeoTile]
+
+
+# Sync schemas
+class SyncDeleted(BaseModel):
+    """Ids deleted since the client's token."""
+
+    plantations: List[str] = []
+    blocks: List[str] = []
+    employees: List[str] = []
+    harvests: List[str] = []
+
+
+class SyncChanges(BaseModel):
+    """Rows created or updated (possibly again) and deleted since ``since``.
+    Pass ``token`` as ``since`` on the next call; while ``has_more`` is
+    true, call again right away for the rest."""
+
+    plantations: List[Plantation]
+    blocks: List[Block]
+    employees: List[Employee]
+    harvests: List[HarvestRecord]
+    deleted: SyncDeleted
+    token: str
+    has_more: bool
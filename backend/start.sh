@@ -8,5 +8,8 @@ done
 
 echo "Database is ready!"
 
+# Apply pending migrations once, before any worker starts
+python migrate.py || exit 1
+
 # Run the application
-exec uvicorn main:app --host 0.0.0.0 --port 8000
\ No newline at end of file
+exec uvicorn main:app --host 0.0.0.0 --port 8000 --timeout-graceful-shutdown 5
\ No newline at end of file
@@ -0,0 +1,34 @@
+"""Cold-start time of an API worker.
+
+Measured from the import of main.py until the startup handlers have run,
+logged once and exported as ``app_startup_seconds`` at /metrics. Starting
+longer than ``STARTUP_BUDGET_SECONDS`` logs a warning, since it slows down
+every deploy, reload and scale-out.
+"""
+
+import logging
+import os
+import time
+from typing import Optional
+
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", 2))
+
+logger = logging.getLogger(__name__)
+
+started_at = time.perf_counter()
+startup_seconds: Optional[float] = None
+
+
+def finished() -> float:
+    """Record the end of startup; call from the last startup handler."""
+    global startup_seconds
+    startup_seconds = time.perf_counter() - started_at
+    if startup_seconds > STARTUP_BUDGET_SECONDS:
+        logger.warning(
+            "Worker startup took %.2fs, over the %.2fs budget",
+            startup_seconds,
+            STARTUP_BUDGET_SECONDS,
+        )
+    else:
+        logger.info("Worker started in %.3fs", startup_seconds)
+    return startup_seconds
@@ -0,0 +1,158 @@
+"""Delta sync for offline clients (field tablets).
+
+A client keeps a local copy of plantations, blocks, employees and harvest
+records and, on reconnect, asks only for what changed since its last
+sync. Changed rows are found through ``updated_at`` (every table has an
+``(updated_at, id)`` index) and deleted rows through ``sync_tombstones``,
+which the ORM fills in the same transaction as the delete.
+
+The token handed to the client is the server time at which its sync
+started. Rows are stamped before their transaction commits, so the next
+sync starts ``SYNC_OVERLAP_SECONDS`` before that time; rows near the
+boundary may be sent twice, which clients handle by upserting on ``id``.
+Large syncs (the first one, without a token) are paged: every table is
+read in ``(updated_at, id)`` order, and while rows remain the token
+carries the last key of each table instead of moving the start time on.
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import Block, Employee, HarvestRecord, Plantation, SyncTombstone
+from pagination import after, decode_cursor, encode_cursor
+import fast_json
+import schemas
+
+load_dotenv()
+
+SYNC_OVERLAP_SECONDS = float(os.getenv("SYNC_OVERLAP_SECONDS", 60))
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", 1000))
+MAX_SYNC_PAGE_SIZE = 5000
+
+
+class Feed(NamedTuple):
+    name: str
+    model: type
+    columns: list
+    order: list
+
+
+FEEDS = [
+    Feed(name, model, fast_json.columns(model, schema), [model.updated_at, model.id])
+    for name, model, schema in [
+        ("plantations", Plantation, schemas.Plantation),
+        ("blocks", Block, schemas.Block),
+        ("employees", Employee, schemas.Employee),
+        ("harvests", HarvestRecord, schemas.HarvestRecord),
+    ]
+]
+TOMBSTONE_ORDER = [SyncTombstone.deleted_at, SyncTombstone.id]
+_FEED_NAMES = {feed.model: feed.name for feed in FEEDS}
+
+# Token: sync start time, start time of the round being paged (or None)
+# and the last key read of each feed and of the tombstones (or None)
+_TOKEN_COLUMNS = [SyncTombstone.deleted_at] * 2 + [
+    column for feed in FEEDS for column in feed.order
+]
+_TOKEN_COLUMNS += TOMBSTONE_ORDER
+
+
+@event.listens_for(Session, "before_flush")
+def record_tombstones(session, flush_context, instances):
+    """Add a tombstone for every synced row deleted in this flush."""
+    for instance in session.deleted:
+        name = _FEED_NAMES.get(type(instance))
+        if name is not None:
+            session.add(SyncTombstone(entity=name, entity_id=instance.id))
+
+
+class Token(NamedTuple):
+    since: Optional[datetime]
+    round_started: Optional[datetime]
+    keys: list
+
+    @classmethod
+    def decode(cls, token: Optional[str]) -> "Token":
+        if not token:
+            return cls(None, None, [None] * (len(FEEDS) + 1))
+        try:
+            values = decode_cursor(token, _TOKEN_COLUMNS)
+        except HTTPException:
+            raise HTTPException(status_code=400, detail="Invalid sync token")
+        pairs = values[2:]
+        keys = [
+            pairs[i : i + 2] if pairs[i] is not None else None
+            for i in range(0, len(pairs), 2)
+        ]
+        return cls(values[0], values[1], keys)
+
+    def encode(self) -> str:
+        values = [self.since, self.round_started]
+        for key in self.keys:
+            values += key if key is not None else [None, None]
+        return encode_cursor(values)
+
+
+async def _read(db: AsyncSession, stmt, order: list, since, key, limit: int):
+    """Up to ``limit`` + 1 rows changed since ``since``, after ``key``."""
+    if since is not None:
+        stmt = stmt.where(order[0] >= since - timedelta(seconds=SYNC_OVERLAP_SECONDS))
+    if key is not None:
+        stmt = stmt.where(after(order, key))
+    result = await db.execute(stmt.order_by(*order).limit(limit + 1))
+    return result.all()
+
+
+async def changes(db: AsyncSession, token: Optional[str], limit: int) -> dict:
+    """The SyncChanges body for a client holding ``token``."""
+    current = Token.decode(token)
+    round_started = current.round_started or datetime.utcnow()
+    body = {}
+    keys = []
+    has_more = False
+    for feed, key in zip(FEEDS, current.keys):
+        rows = await _read(
+            db, select(*feed.columns), feed.order, current.since, key, limit
+        )
+        has_more |= len(rows) > limit
+        rows = rows[:limit]
+        body[feed.name] = fast_json.records(rows)
+        keys.append([rows[-1].updated_at, rows[-1].id] if rows else key)
+
+    # A client without a token starts empty and has nothing to delete
+    deleted = {feed.name: [] for feed in FEEDS}
+    tombstone_key = current.keys[-1]
+    if current.since is not None:
+        rows = await _read(
+            db,
+            select(
+                SyncTombstone.entity,
+                SyncTombstone.entity_id,
+                *TOMBSTONE_ORDER,
+            ),
+            TOMBSTONE_ORDER,
+            current.since,
+            tombstone_key,
+            limit,
+        )
+        has_more |= len(rows) > limit
+        rows = rows[:limit]
+        for row in rows:
+            deleted[row.entity].append(row.entity_id)
+        if rows:
+            tombstone_key = [rows[-1].deleted_at, rows[-1].id]
+    keys.append(tombstone_key)
+
+    if has_more:
+        following = Token(current.since, round_started, keys)
+    else:
+        following = Token(round_started, None, [None] * len(keys))
+    body.update(deleted=deleted, token=following.encode(), has_more=has_more)
+    return body
@@ -0,0 +1,55 @@
+"""Calendar buckets for time-series aggregation.
+
+``date_bucket`` truncates a date/datetime column to the start of its day,
+ISO week (Monday) or month in SQL; ``bucket_range`` lists the same bucket
+starts in Python so series can be gap-filled with zeros.
+"""
+
+from datetime import date, timedelta
+from typing import List
+
+from sqlalchemy import Date, cast, func, type_coerce
+
+GRANULARITIES = ("day", "week", "month")
+
+
+def date_bucket(dialect_name: str, granularity: str, column):
+    """SQL expression for the first day of the bucket containing ``column``."""
+    if dialect_name == "postgresql":
+        return cast(func.date_trunc(granularity, column), Date)
+    if dialect_name == "sqlite":
+        if granularity == "day":
+            expression = func.date(column)
+        elif granularity == "week":
+            # Forward to Sunday (or stay on it), then back to that week's Monday
+            expression = func.date(column, "weekday 0", "-6 days")
+        else:
+            expression = func.strftime("%Y-%m-01", column)
+        return type_coerce(expression, Date)
+    raise NotImplementedError(f"Date buckets not supported on {dialect_name}")
+
+
+def truncate(value: date, granularity: str) -> date:
+    if granularity == "week":
+        return value - timedelta(days=value.weekday())
+    if granularity == "month":
+        return value.replace(day=1)
+    return value
+
+
+def next_bucket(value: date, granularity: str) -> date:
+    if granularity == "week":
+        return value + timedelta(days=7)
+    if granularity == "month":
+        return (value.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return value + timedelta(days=1)
+
+
+def bucket_range(start: date, end: date, granularity: str) -> List[date]:
+    """Start of every bucket overlapping ``start``..``end`` (inclusive)."""
+    buckets = []
+    current = truncate(start, granularity)
+    while current <= end:
+        buckets.append(current)
+        current = next_bucket(current, granularity)
+    return buckets
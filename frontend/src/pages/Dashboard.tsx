@@ -1,6 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import { DashboardStats } from '../types';
 import api from '../utils/api';
+import { subscribe } from '../utils/eventStream';
 import { TrendingUp, MapPin, Users, Wheat } from 'lucide-react';
 
 const Dashboard: React.FC = () => {
@@ -9,6 +10,26 @@ const Dashboard: React.FC = () => {
 
   useEffect(() => {
     fetchDashboardStats();
+
+    // Live totals pushed by the server: a snapshot, then increments
+    return subscribe('/dashboard/stream', ({ event, data }) => {
+      const { seq, ...totals } = data;
+      if (event === 'snapshot') {
+        setStats(totals);
+        setLoading(false);
+      } else if (event === 'delta') {
+        setStats((current) => {
+          if (!current) {
+            return current;
+          }
+          const next = { ...current };
+          (Object.keys(totals) as (keyof DashboardStats)[]).forEach((name) => {
+            next[name] += totals[name];
+          });
+          return next;
+        });
+      }
+    });
   }, []);
 
   const fetchDashboardStats = async () => {
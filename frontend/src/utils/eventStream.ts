@@ -0,0 +1,83 @@
+import { API_BASE_URL } from '../types';
+
+export interface StreamEvent {
+  event: string;
+  data: any;
+}
+
+const RECONNECT_DELAY_MS = 5000;
+
+const readEvents = async (
+  path: string,
+  onEvent: (event: StreamEvent) => void,
+  signal: AbortSignal
+) => {
+  // EventSource cannot send the Authorization header, so read the stream with fetch
+  const token = localStorage.getItem('access_token');
+  const response = await fetch(`${API_BASE_URL}${path}`, {
+    headers: token ? { Authorization: `Bearer ${token}` } : {},
+    signal,
+  });
+  if (!response.ok || !response.body) {
+    throw new Error(`Stream ${path} failed: ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) {
+      return;
+    }
+    buffer += decoder.decode(value, { stream: true });
+    let end = buffer.indexOf('\n\n');
+    while (end !== -1) {
+      const block = buffer.slice(0, end);
+      buffer = buffer.slice(end + 2);
+      end = buffer.indexOf('\n\n');
+
+      let event = 'message';
+      const data: string[] = [];
+      block.split('\n').forEach((line) => {
+        if (line.startsWith('event:')) {
+          event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+          data.push(line.slice(5).trim());
+        }
+      });
+      // Lines starting with ':' are keep-alive comments
+      if (data.length > 0) {
+        onEvent({ event, data: JSON.parse(data.join('\n')) });
+      }
+    }
+  }
+};
+
+/**
+ * Subscribe to a server-sent event stream of the API, reconnecting after
+ * errors until the returned function is called.
+ */
+export const subscribe = (
+  path: string,
+  onEvent: (event: StreamEvent) => void
+): (() => void) => {
+  const controller = new AbortController();
+
+  const run = async () => {
+    while (!controller.signal.aborted) {
+      try {
+        await readEvents(path, onEvent, controller.signal);
+      } catch (error) {
+        if (controller.signal.aborted) {
+          return;
+        }
+        console.error('Event stream error:', error);
+      }
+      await new Promise((resolve) => setTimeout(resolve, RECONNECT_DELAY_MS));
+    }
+  };
+  run();
+
+  return () => controller.abort();
+};
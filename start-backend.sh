@@ -13,13 +13,8 @@ echo "✅ PostgreSQL is running"
 # Setup backend
 cd /home/titan/project/wad-fap-agri/backend
 
-# Create tables and users
-python -c "
-from database import engine
-from models import Base
-Base.metadata.create_all(bind=engine)
-print('✅ Database tables created/verified')
-"
+# Apply database migrations
+python migrate.py || exit 1
 
 # Create users if not exist
 python create_users_simple.py
@@ -34,4 +29,4 @@ echo "   Username: admin | Password: admin123"
 echo "   Username: field1 | Password: field123"
 echo ""
 
-uvicorn main:app --reload --host 0.0.0.0 --port 8000
\ No newline at end of file
+uvicorn main:app --reload --host 0.0.0.0 --port 8000 --timeout-graceful-shutdown 5
\ No newline at end of file
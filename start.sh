@@ -17,19 +17,14 @@ createdb -h localhost -p 5432 -U postgres wad_fap_agri_db 2>/dev/null || echo "
 echo "🔧 Setting up backend..."
 cd backend
 
-# Create tables and users
-python -c "
-from database import engine
-from models import Base
-Base.metadata.create_all(bind=engine)
-print('✅ Database tables created')
-"
+# Apply database migrations
+python migrate.py || exit 1
 
 # Create users if not exist
 python create_users_simple.py
 
 echo "🚀 Starting backend server on http://localhost:8000"
-uvicorn main:app --reload --host 0.0.0.0 --port 8000 &
+uvicorn main:app --reload --host 0.0.0.0 --port 8000 --timeout-graceful-shutdown 5 &
 BACKEND_PID=$!
 
 # Wait for backend to start